@@ -30,6 +30,7 @@ Elementwise provides three proxy objects:
     when a member value is a non string iterable, it will recursively try to
     apply the operation to child nodes.  This proxy is capable of arbitrary
     graph traversal in a depth first fashion, and will not visit a node twice.
+    Mappings are traversed through their values.
 
 Each of the proxy objects can mutate into any of the other types by calling a
 mutator method.
@@ -43,6 +44,12 @@ mutator method.
 * :meth:`RecursiveElementwiseProxyMixin.recurse`
     mutates the current proxy into a :class:`RecursiveElementwiseProxy`.
     
+For lists of records (dicts, tuples or objects), :class:`RecordProxy` transposes the
+records into one column per field, and returns the columns as
+:class:`PairwiseProxy` objects by attribute or item access.
+:class:`CSVSource` reads a CSV file as records, decoding only the fields that a
+chain or a :class:`RecordProxy` reads.
+
 When you would like to perform the operation chain represented by your proxy,
 simply iterate over it. The easiest way to do this is probably to call list with
 the proxy as the argument.
@@ -52,10 +59,36 @@ all :class:`OperationProxy` subclasses support :meth:`OperationProxy.replicate`
 which takes an iterable and generates a new chain, which is a duplicate of the
 current chain with that iterable as the base data source.
 
+To filter a chain, :meth:`OperationProxy.where` takes a predicate chain built from the same
+source, a function or a boolean mask.  Predicates which branch off the
+chain before expensive steps are applied first, so those steps only see
+the elements that are kept.
+Similarly, the :func:`where` function selects one of two chains or constants
+for each element, and only evaluates a chain for the elements it is selected
+for.
+
+To apply a chain to many iterables, :meth:`OperationProxy.plan` compiles the
+chain into a :class:`Plan`, which can be called with an iterable to evaluate
+the chain over it without replicating the chain, or mapped over many
+iterables at once.
+Plans fuse runs of elementwise operations into generated functions; set
+elementwise.kernel_cache to a directory to keep them across processes.
+Chains can also be built without any data, on the proxy returned by
+:meth:`OperationProxy.placeholder`, and applied to an iterable with
+:meth:`OperationProxy.bind`, replicate or plan.
+Chains and plans can be pickled, with or without their source (see
+:meth:`OperationProxy.unbind`), as long as the functions they apply can be
+imported by name.
+
 If for some reason you would like to undo an operation, all :class:`OperationProxy`
 subclasses support :meth:`OperationProxy.undo`, which accepts an integer number
 of operations that should be undone (defaulting to 1) and returns a reference to
 the :class:`OperationProxy` representing that step in the chain.
+
+To release the intermediate steps of a long chain, all :class:`OperationProxy`
+subclasses support :meth:`OperationProxy.detach`, which collapses the chain into a
+single step on top of its source.  The caching and weak parent policies
+described on :class:`OperationProxy` control how much of a chain is kept otherwise.
     
 .. note::
     
@@ -65,80 +98,202 @@ the :class:`OperationProxy` representing that step in the chain.
     broadcast these operations, use :meth:`ElementwiseProxy.apply`. 
 """
 
-from decorator import decorator
+import array
 import collections
+import csv
+import functools
 import itertools
+import json
+import keyword
+import marshal
 import operator
+import os
+import re
+import sys
+import threading
 import types
+import weakref
 
 __author__ = 'Nathan Rice <nathan.alexander.rice@gmail.com>'
+__version__ = '0.120114'
 
 
-# We don't want to evaluate this until absolutely required.
-_iterable = lambda x: object.__getattribute__(x, "iterable")
+_JSON_WHITESPACE = re.compile(r"[ \t\n\r]*")
+_JSON_DELIMITER = re.compile(r"[ \t\n\r,:\]}]")
+_JSON_STRING_STOP = re.compile(r'["\\]')
+_JSON_ERROR = re.compile(r"(.*?):? line \d+ column \d+ \(char (\d+)\)")
+_JSON_NUMBER = re.compile(r"(-?(?:0|[1-9]\d*))(\.\d+)?([eE][-+]?\d+)?")
+_IDENTIFIER = re.compile(r"[A-Za-z_][A-Za-z0-9_]*$")
 
-def _cacheable(proxy):
-    try:
-        return object.__getattribute__(proxy, "__cacheable__")
-    except AttributeError:
-        return False
-
-def create_cell(obj):
-    """Create a cell object which references `obj`."""
-    return (lambda: obj).func_closure[0]
-
-def copy_func(f, code=None, globals_=None, name=None, argdefs=None, closure=None):
-    """Create a copy of a function, replacing any portions specified."""
-    return types.FunctionType(
-        code or f.func_code,
-        globals_ or f.func_globals,
-        name or f.func_name,
-        argdefs or f.func_defaults,
-        closure or f.func_closure
-    )
+# The directory in which the kernels compiled for plans are kept, so that
+# later processes can load them instead of compiling them again.  None keeps
+# them in memory only.
+kernel_cache = None
 
-def as_strlike(iterable, f=str):
+# The default summarization options for the string representations of
+# recursive proxies, see set_printoptions.
+printoptions = {"edgeitems": 20, "depth": 16, "width": 10000}
+
+def set_printoptions(**options):
     """
-    Generate a string-like representation of `iterable`, using `f`.  repr
-    requires special case behavior, since the repr() of a string is enclosed in
-    an additional set of quotes.
+    Set the default summarization options for the string representations of
+    :class:`RecursiveElementwiseProxy` objects.  Any option may be None, which
+    turns that limit off.
+
+    :parameter edgeitems:
+        The number of leading children shown for each branch.
+
+    :parameter depth:
+        The number of nesting levels shown.
+
+    :parameter width:
+        The maximum length of the representation, in characters.
+    """
+    printoptions.update(_printoptions(options))
+
+def _printoptions(options):
+    """Validate print `options`, returning the complete set of options."""
+    for option in options:
+        if option not in printoptions:
+            raise TypeError("Unknown print option %r" % option)
+    return dict(printoptions, **options)
+
+def strlike_fragments(iterable, f=str, edgeitems=None, depth=None):
+    """
+    Generate the fragments of a string-like representation of `iterable`,
+    using `f` for the leaves.  repr requires special case behavior, since the
+    repr() of a string is enclosed in an additional set of quotes.  String
+    leaves are shown as they are by repr and str, so unicode leaves make the
+    fragments unicode, rather than failing to encode.
+
+    Branches show at most `edgeitems` children, followed by "..." if there are
+    more, and branches nested more than `depth` levels deep are shown as
+    "(...)".  Elements are only evaluated as the fragments that show them are
+    generated, apart from the one past `edgeitems` that shows there are more.
     """
     if f == repr: # don't repr() strings...
-        f = lambda x: isinstance(x, basestring) and str(x) or repr(x)
+        f = lambda x: x if isinstance(x, basestring) and x else repr(x)
+    elif f == str:
+        f = lambda x: x if isinstance(x, basestring) else str(x)
     visited = set()
-    def stringify_iterable(iterable):
-        if not isinstance(iterable, (collections.Iterable)) or \
-           isinstance(iterable, basestring):
-            yield f(iterable)
-        elif id(iterable) not in visited:
-            visited.add(id(iterable))
-            yield f("(")
-            first = True
-            for i in iterable:
-                if not first:
-                    yield f(", ")
-                else:
-                    first = False
-                for j in stringify_iterable(i):
+    def stringify_iterable(iterable, level):
+        if depth is not None and level >= depth:
+            yield "(...)"
+            return
+        yield "("
+        shown = 0
+        for _, i in branch_slots(iterable):
+            if is_branch(i) and not isinstance(i, collections.Iterator):
+                if id(i) in visited:
+                    continue
+                visited.add(id(i))
+            if shown == edgeitems:
+                yield ", ..."
+                break
+            if shown:
+                yield ", "
+            shown += 1
+            if is_branch(i):
+                for j in stringify_iterable(i, level + 1):
                     yield j
-            yield f(")")
-    return f("").join(stringify_iterable(iterable))
+            else:
+                yield f(i)
+        yield ")"
+    if not is_branch(iterable):
+        yield f(iterable)
+        return
+    if not isinstance(iterable, collections.Iterator):
+        visited.add(id(iterable))
+    for fragment in stringify_iterable(iterable, 0):
+        yield fragment
+
+def as_strlike(iterable, f=str):
+    """
+    Generate a string-like representation of `iterable`, using `f`.
+    """
+    return "".join(strlike_fragments(iterable, f))
+
+def summarize(iterable, f=str, edgeitems=None, depth=None, width=None):
+    """
+    Generate a summarized string-like representation of `iterable`, using `f`.
+    See :func:`strlike_fragments` for `edgeitems` and `depth`.  Representations
+    longer than `width` characters are cut off with "...", and no more elements
+    are evaluated once `width` has been reached.
+    """
+    fragments = strlike_fragments(iterable, f, edgeitems, depth)
+    if width is None:
+        return "".join(fragments)
+    output = []
+    length = 0
+    for fragment in fragments:
+        output.append(fragment)
+        length += len(fragment)
+        if length > width:
+            return "".join(output)[:width] + "..."
+    return "".join(output)
+
+def write_strlike(fp, iterable, f=str, chunksize=65536):
+    """
+    Write the full string-like representation of `iterable` to the file object
+    `fp`, in chunks of roughly `chunksize` characters, without building the
+    whole string.
+    """
+    chunk = []
+    length = 0
+    for fragment in strlike_fragments(iterable, f):
+        chunk.append(fragment)
+        length += len(fragment)
+        if length >= chunksize:
+            fp.write(_encoded("".join(chunk)))
+            chunk = []
+            length = 0
+    if chunk:
+        fp.write(_encoded("".join(chunk)))
+
+def _encoded(text):
+    """
+    Encode `text`, a representation joined from unicode fragments, as UTF-8.
+    """
+    return text.encode("utf-8") if isinstance(text, unicode) else text
+
+def is_branch(node):
+    """
+    Return True if `node` is a branch of a nested structure: any iterable that
+    is not a string.
+    """
+    return isinstance(node, collections.Iterable) and \
+        not isinstance(node, basestring)
+
+def branch_slots(branch):
+    """
+    Generate (slot, child) pairs for `branch`.  Mappings are traversed through
+    their values, with the key as the slot.  Everything else is enumerated, with
+    the index as the slot.
+    """
+    if isinstance(branch, collections.Mapping):
+        return ((key, branch[key]) for key in branch)
+    return enumerate(branch)
 
 def graphmap(f, graph):
     """
     Depth first graph traversal and function application.  Cycles are
     avoided by maintaining a set of observed object ids and testing for set
-    membership before edge traversal.
+    membership before edge traversal.  Only containers are recorded; iterators
+    (such as the branches produced by an upstream graphmap) can't be revisited,
+    and their ids are recycled as soon as they are exhausted.
     """
-    visited = set()
+    # The root is recorded too, so that a structure containing itself is not
+    # walked twice.
+    visited = set() if isinstance(graph, collections.Iterator) else \
+        set([id(graph)])
     def traverse_branch(branch):
-        for node in branch:
-            if id(node) in visited:
-                continue
-            if isinstance(node, (collections.Iterable)) and \
-               not isinstance(node, basestring):
+        for _, node in branch_slots(branch):
+            if is_branch(node):
                 # We are at a branch
-                visited.add(id(node))
+                if not isinstance(node, collections.Iterator):
+                    if id(node) in visited:
+                        continue
+                    visited.add(id(node))
                 yield traverse_branch(node)
             else:
                 # We are at a leaf
@@ -146,6 +301,685 @@ def graphmap(f, graph):
     for n in traverse_branch(graph):
         yield n
 
+def materialize(graph):
+    """
+    Recursively build tuples out of a structure of nested iterables, such as
+    the output of :func:`graphmap`.
+    """
+    return tuple(materialize(n) if is_branch(n) else n for n in graph)
+
+def rebuild(branch, values):
+    """
+    Build a copy of the immutable container `branch` holding `values`,
+    preserving its type where the type allows it.
+    """
+    if isinstance(branch, collections.Mapping):
+        return dict(itertools.izip(branch, values))
+    if isinstance(branch, tuple) and hasattr(branch, "_make"):
+        # Named tuples take their fields as separate arguments.
+        return branch._make(values)
+    try:
+        return type(branch)(values)
+    except TypeError:
+        return tuple(values)
+
+def writeback(source, results, copy=True):
+    """
+    Store the leaves of `results`, the evaluated form of the nested structure
+    `source`, into the corresponding slots of `source`.  `source` and `results`
+    are walked in lockstep as `results` is generated, using the same branch
+    rules as :func:`graphmap`, so the structure is traversed only once.
+
+    Immutable branches are replaced by a copy in their parent's slot if `copy`
+    is true, otherwise a TypeError is raised before anything is written.
+    Returns `source`, or a copy of it if `source` itself is immutable.
+    """
+    if not copy:
+        branch = _immutable_branch(source)
+        if branch is not None:
+            raise TypeError("Can't write back into immutable %s" %
+                            type(branch).__name__)
+    visited = set([id(source)])
+    def writeback_branch(branch, results):
+        # Previewed results are re-iterable branches rather than iterators.
+        results = iter(results)
+        mutable = isinstance(branch, (collections.MutableSequence,
+                                      collections.MutableMapping))
+        values = []
+        for slot, node in branch_slots(branch):
+            if isinstance(node, collections.Iterator):
+                # The chain consumes iterators, there is nothing to write into.
+                value = materialize(next(results))
+            elif is_branch(node):
+                if id(node) in visited:
+                    continue
+                visited.add(id(node))
+                value = writeback_branch(node, next(results))
+            else:
+                value = next(results)
+                if is_branch(value):
+                    # A later operation turned the leaf into a branch.
+                    value = materialize(value)
+            if mutable:
+                branch[slot] = value
+            else:
+                values.append(value)
+        return branch if mutable else rebuild(branch, values)
+    return writeback_branch(source, results)
+
+def _immutable_branch(source):
+    """
+    Return the first branch of the nested structure `source` that can't be
+    written into, or None, see :func:`writeback`.
+    """
+    visited = set([id(source)])
+    stack = [source]
+    while stack:
+        branch = stack.pop()
+        if not isinstance(branch, (collections.MutableSequence,
+                                   collections.MutableMapping)):
+            return branch
+        for _, node in branch_slots(branch):
+            if is_branch(node) and not isinstance(node, collections.Iterator) \
+                    and id(node) not in visited:
+                visited.add(id(node))
+                stack.append(node)
+    return None
+
+class _Subtree(object):
+    """
+    Placeholder for the part of a branch's output that is computed by another
+    task.  The output of a run of siblings is spliced into the branch output, the
+    output of a split off branch is nested.
+    """
+
+    def __init__(self, splice=False):
+        self.splice = splice
+        self.values = None
+
+def _splittable(node, grain, sizes):
+    """
+    Return True if `node` is a branch whose children can be addressed by slot,
+    with at least `grain` nodes below it, see :func:`_survey`.
+    """
+    return isinstance(node, (collections.Sequence, collections.Mapping)) and \
+        not isinstance(node, basestring) and sizes.get(id(node), 0) >= grain
+
+def _resolve(source, path):
+    """Follow the slots in `path` down from `source`."""
+    for slot in path:
+        source = source[slot]
+    return source
+
+def _survey(source):
+    """
+    Walk the nested structure `source` once, returning two mappings keyed by
+    the ids of its containers: the (parent id, slot) of their first occurrence
+    in depth first order, the only occurrence that :func:`graphmap` traverses,
+    and the number of nodes traversed below that occurrence.
+    """
+    first = {id(source): None}
+    sizes = {id(source): 0}
+    parents = [id(source)]
+    stack = [iter(branch_slots(source))]
+    while stack:
+        for slot, node in stack[-1]:
+            if not is_branch(node) or \
+                    isinstance(node, collections.Iterator):
+                sizes[parents[-1]] += 1
+            elif id(node) not in first:
+                sizes[parents[-1]] += 1
+                first[id(node)] = (parents[-1], slot)
+                sizes[id(node)] = 0
+                parents.append(id(node))
+                stack.append(iter(branch_slots(node)))
+                break
+        else:
+            stack.pop()
+            done = parents.pop()
+            if parents:
+                sizes[parents[-1]] += sizes[done]
+    return first, sizes
+
+def _traversed(branch, slot, node, first):
+    """
+    Return True unless `node`, the child in `slot` of `branch`, is a container
+    that graphmap skips there, see :func:`_survey`.
+    """
+    if not is_branch(node) or isinstance(node, collections.Iterator):
+        return True
+    return first.get(id(node)) == (id(branch), slot)
+
+def _pruned(branch, first):
+    """
+    Generate the children of `branch` that graphmap traverses, with containers
+    replaced by generators of their own traversed children.
+    """
+    for slot, node in branch_slots(branch):
+        if not _traversed(branch, slot, node, first):
+            continue
+        if is_branch(node) and not isinstance(node, collections.Iterator):
+            yield _pruned(node, first)
+        else:
+            yield node
+
+def _evaluate_run(chain, branch, run, first):
+    """
+    Evaluate `chain` over the children in the slots `run` of `branch`,
+    returning a list of materialized results.  Containers are passed as
+    generators of the children graphmap traverses over the whole source, so
+    that the results have the same shape as a serial evaluation.
+    """
+    nodes = []
+    for slot in run:
+        node = branch[slot]
+        if is_branch(node) and not isinstance(node, collections.Iterator):
+            node = _pruned(node, first)
+        nodes.append(node)
+    return list(materialize(chain.replicate(nodes)))
+
+def _split_branch(chain, branch, grain, survey):
+    """
+    Split the children of `branch` into tasks: one for every child with at
+    least `grain` nodes below it, and one for every run of smaller siblings
+    with about `grain` nodes between them.  The last run is evaluated right
+    away.  Containers which graphmap skips at their slot are left out, see
+    :func:`_survey`.
+
+    Returns the output of the branch, with :class:`_Subtree` placeholders, and
+    the new tasks as (placeholder, slot, run) triples: `slot` is the slot of a
+    split off child, and `run` is the list of slots in a run of siblings.
+    """
+    first, sizes = survey
+    values, tasks, run, size = [], [], [], 0
+    for slot, node in branch_slots(branch):
+        if not _traversed(branch, slot, node, first):
+            continue
+        if _splittable(node, grain, sizes):
+            placeholder = _Subtree()
+            values.append(placeholder)
+            tasks.append((placeholder, slot, None))
+            run = []
+            continue
+        if not run or size >= grain:
+            run, size = [], 0
+            placeholder = _Subtree(splice=True)
+            values.append(placeholder)
+            tasks.append((placeholder, None, run))
+        run.append(slot)
+        size += 1 + sizes.get(id(node), 0)
+    if tasks and tasks[-1][2] is not None:
+        placeholder, _, last = tasks.pop()
+        placeholder.values = _evaluate_run(chain, branch, last, first)
+    return values, tasks
+
+def _run_task(chain, source, grain, survey, path, run):
+    """
+    Run a task produced by :func:`_split_branch`, returning the task's output
+    and any new tasks.
+    """
+    branch = _resolve(source, path)
+    if run is not None:
+        return _evaluate_run(chain, branch, run, survey[0]), []
+    return _split_branch(chain, branch, grain, survey)
+
+def _expand(path, tasks):
+    """
+    Turn the (placeholder, slot, run) triples returned for the branch at `path`
+    into (placeholder, path, run) tasks.
+    """
+    return [(placeholder, path, run) if slot is None else
+            (placeholder, path + (slot,), None)
+            for placeholder, slot, run in tasks]
+
+def _assemble(values):
+    """Replace the placeholders in the output of a split branch."""
+    assembled = []
+    for value in values:
+        if not isinstance(value, _Subtree):
+            assembled.append(value)
+        elif value.splice:
+            assembled.extend(value.values)
+        else:
+            assembled.append(_assemble(value.values))
+    return tuple(assembled)
+
+def _steal_work(chain, source, grain, survey, root, workers):
+    """
+    Run the split tasks for `source` on `workers` threads.  Every worker pushes
+    the tasks it spawns onto the end of its own deque and pops from there, so it
+    works depth first on the subtree it is in.  Idle workers steal from the
+    front of the other deques, which holds the oldest, and so typically the
+    largest, outstanding subtrees.
+    """
+    deques = [collections.deque() for _ in range(workers)]
+    deques[0].append(root)
+    condition = threading.Condition()
+    state = {"pending": 1, "error": None}
+
+    def work(index):
+        own = deques[index]
+        victims = deques[index + 1:] + deques[:index]
+        while state["error"] is None:
+            try:
+                task = own.pop()
+            except IndexError:
+                task = None
+                for victim in victims:
+                    try:
+                        task = victim.popleft()
+                        break
+                    except IndexError:
+                        pass
+            if task is None:
+                with condition:
+                    if not state["pending"]:
+                        return
+                    condition.wait(0.01)
+                continue
+            placeholder, path, run = task
+            try:
+                placeholder.values, tasks = _run_task(chain, source, grain,
+                                                      survey, path, run)
+            except Exception:
+                with condition:
+                    state["error"] = sys.exc_info()
+                    condition.notify_all()
+                return
+            with condition:
+                tasks = _expand(path, tasks)
+                state["pending"] += len(tasks)
+                own.extend(tasks)
+                state["pending"] -= 1
+                condition.notify_all()
+
+    threads = [threading.Thread(target=work, args=(i,))
+               for i in range(workers)]
+    for thread in threads:
+        thread.daemon = True
+        thread.start()
+    for thread in threads:
+        thread.join()
+    if state["error"] is not None:
+        raise state["error"][0], state["error"][1], state["error"][2]
+
+# The chain, source and grain of the running process pool evaluation.  Workers
+# inherit it when they are forked, so neither has to be pickled.
+_parallel_state = None
+
+def _process_task(path, run):
+    chain, source, grain, survey = _parallel_state
+    return _run_task(chain, source, grain, survey, path, run)
+
+def _plan_task(index):
+    evaluate, sources = _parallel_state
+    return evaluate(sources[index])
+
+def _share_work(chain, source, grain, survey, root, workers):
+    """
+    Run the split tasks for `source` on a pool of `workers` processes.  Tasks
+    are queued on the pool as soon as the task that spawned them completes, and
+    idle workers take the next task from the shared queue.
+    """
+    global _parallel_state
+    # multiprocessing is slow to import, and only needed here.
+    import multiprocessing
+    _parallel_state = (chain, source, grain, survey)
+    pool = multiprocessing.Pool(workers)
+    try:
+        def submit(task):
+            placeholder, path, run = task
+            result = pool.apply_async(_process_task, (path, run))
+            return placeholder, path, result
+        outstanding = [submit(root)]
+        while outstanding:
+            ready = [task for task in outstanding if task[2].ready()]
+            if not ready:
+                outstanding[0][2].wait(0.01)
+                continue
+            for task in ready:
+                outstanding.remove(task)
+                placeholder, path, result = task
+                placeholder.values, tasks = result.get()
+                outstanding.extend(
+                    submit(t) for t in _expand(path, tasks))
+    finally:
+        pool.terminate()
+        _parallel_state = None
+
+def _recursive_source(proxy, operation):
+    """
+    Return the source of a chain of recursive operations ending in `proxy`.
+    """
+    current = proxy
+    parent = _parent(current)
+    while parent is not None:
+        if not isinstance(current, RecursiveElementwiseProxy):
+            raise TypeError("%s requires a chain of recursive operations, "
+                            "found %s" % (operation, type(current).__name__))
+        current = parent
+        parent = _parent(current)
+    return _iterable(current)
+
+def _source(proxy):
+    """Return the source of the chain ending in `proxy`."""
+    parent = _parent(proxy)
+    while parent is not None:
+        proxy, parent = parent, _parent(parent)
+    return _iterable(proxy)
+
+def _steps(proxy):
+    """
+    Return the source of the chain ending in `proxy`, and the steps leading
+    from it to `proxy` as (proxy type, operation) pairs.
+    """
+    steps = []
+    parent = _parent(proxy)
+    while parent is not None:
+        steps.append((type(proxy), _operation(proxy)))
+        proxy, parent = parent, _parent(parent)
+    steps.reverse()
+    return proxy, tuple(steps)
+
+def _replay(proxy, steps):
+    """Replay `steps`, see :func:`_steps`, on top of `proxy`."""
+    for cls, operation in steps:
+        if operation is None:
+            # Mutators (each, recurse, pair) simply wrap their parent.
+            proxy = cls(proxy, proxy)
+        else:
+            name, args, kwargs = operation
+            # A collapsed step is recorded with the type of its result, which
+            # need not be the type of the proxy it is replayed on.
+            method = getattr(cls, name).im_func
+            proxy = method(proxy, *args, **(kwargs or {}))
+    return proxy
+
+def _stages(proxy):
+    """
+    Return the stages leading from the source of the chain ending in `proxy`
+    to `proxy`, see :meth:`OperationProxy._chain`.  Mutators have no stage.
+    """
+    stages = []
+    parent = _parent(proxy)
+    while parent is not None:
+        stage = _stage(proxy)
+        if stage is not None:
+            stages.append(stage)
+        proxy, parent = parent, _parent(parent)
+    stages.reverse()
+    return tuple(stages)
+
+def _lockstep_stages(proxy, stop=None):
+    """
+    Like :func:`_stages`, without the steps that materialize their results
+    (checkpoints and persisted steps), which generate the same results but
+    don't evaluate the steps before them in lockstep with the source.  Only
+    the steps after `stop` are included.
+    """
+    stages = []
+    parent = _parent(proxy)
+    while parent is not None and proxy is not stop:
+        name, args, _ = _operation(proxy)
+        if name == "_collapse":
+            result = _replay(parent, args[0])
+            stages.append(_compose(_lockstep_stages(result, parent)))
+        elif name not in ("checkpoint", "persist"):
+            stage = _stage(proxy)
+            if stage is not None:
+                stages.append(stage)
+        proxy, parent = parent, _parent(parent)
+    stages.reverse()
+    return tuple(stages)
+
+def _compose(stages):
+    """Compose `stages` into a single stage."""
+    def stage(iterable, source, params):
+        for s in stages:
+            iterable = s(iterable, source, params)
+        return iterable
+    return stage
+
+# The default of parameters without one.
+_missing = object()
+
+class Param(object):
+    """
+    A named parameter, which can be used in place of an operand or argument
+    when building a chain, and is resolved each time the chain is evaluated,
+    see :meth:`OperationProxy.bind` and :class:`Plan`.  For example::
+
+        >>> plan = (ElementwiseProxy.placeholder() * Param("scale")).plan()
+        >>> list(plan([1, 2], scale=3))
+        [3, 6]
+    """
+
+    __slots__ = ("name", "default")
+
+    def __init__(self, name, default=_missing):
+        self.name = name
+        self.default = default
+
+    def resolve(self, params):
+        """Return the value of the parameter in the mapping `params`."""
+        value = params.get(self.name, self.default)
+        if value is _missing:
+            raise TypeError("No value for parameter %r" % self.name)
+        return value
+
+    def __repr__(self):
+        return "Param(%r)" % self.name
+
+    def __reduce__(self):
+        if self.default is _missing:
+            return Param, (self.name,)
+        return Param, (self.name, self.default)
+
+def _parameterized(value):
+    if isinstance(value, Param):
+        return True
+    if isinstance(value, tuple):
+        return any(isinstance(v, Param) for v in value)
+    if isinstance(value, dict):
+        return any(isinstance(v, Param) for v in value.itervalues())
+    return False
+
+def _resolve_params(value, params):
+    """Resolve the parameters in `value`, or in its items or values."""
+    if isinstance(value, Param):
+        return value.resolve(params)
+    if isinstance(value, tuple):
+        return tuple(_resolve_params(v, params) for v in value)
+    if isinstance(value, dict):
+        return dict((k, _resolve_params(v, params))
+                    for k, v in value.iteritems())
+    return value
+
+def _parameterize(make_stage, *values):
+    """
+    Return make_stage(*values).  If `values` contain parameters, the call is
+    deferred to each evaluation, once the parameters have been resolved.
+    """
+    if not any(_parameterized(value) for value in values):
+        return make_stage(*values)
+    def stage(iterable, source, params):
+        resolved = [_resolve_params(value, params) for value in values]
+        return make_stage(*resolved)(iterable, source, params)
+    return stage
+
+class _Placeholder(object):
+    """
+    The source of a chain built with :meth:`OperationProxy.placeholder`, which
+    can not be evaluated.
+    """
+
+    __slots__ = ("name",)
+
+    def __init__(self, name):
+        self.name = name
+
+    def __iter__(self):
+        raise ValueError("The source %r of this chain is not bound, see "
+                         "OperationProxy.bind" % self.name)
+
+    def __repr__(self):
+        return "<unbound source %r>" % self.name
+
+    def __reduce__(self):
+        return _Placeholder, (self.name,)
+
+class _RetainedBranch(object):
+    """
+    A lazy branch of the results of a recursive chain, which keeps the items
+    generated from it, so that they are generated again by later iterations
+    instead of being lost.  See :meth:`RecursiveElementwiseProxy.head`.
+    """
+
+    __slots__ = ("items", "rest")
+
+    def __init__(self, branch):
+        self.items = []
+        self.rest = branch
+
+    def __iter__(self):
+        for item in self.items:
+            yield item
+        for item in self.rest:
+            item = _retain(item)
+            self.items.append(item)
+            yield item
+
+def _retain(node):
+    """Wrap `node` in a :class:`_RetainedBranch` if it is a lazy branch."""
+    if is_branch(node) and isinstance(node, collections.Iterator):
+        return _RetainedBranch(node)
+    return node
+
+class _ItemIndexer(object):
+    """The elementwise indexer of :attr:`OperationProxy.item`."""
+
+    __slots__ = ("proxy",)
+
+    def __init__(self, proxy):
+        self.proxy = proxy
+
+    def __getitem__(self, key):
+        return self.proxy._item(key)
+
+    def __repr__(self):
+        return "<item indexer of %s>" % type(self.proxy).__name__
+
+def _itemgetter(key):
+    """
+    Return the function of e[key], or of the tuple of items if `key` is a
+    tuple, see :attr:`OperationProxy.item`.
+    """
+    if not isinstance(key, tuple):
+        return operator.itemgetter(key)
+    if len(key) == 1:
+        # itemgetter only returns tuples for several keys.
+        getter = operator.itemgetter(key[0])
+        return lambda e: (getter(e),)
+    return operator.itemgetter(*key)
+
+def _restore(cls, source, steps):
+    """Rebuild a pickled chain, see :meth:`OperationProxy.__reduce__`."""
+    return _replay(cls(source), steps)
+
+def _restore_plan(cls, steps):
+    """Rebuild a pickled plan, see :meth:`Plan.__reduce__`."""
+    return _restore(cls, _Placeholder("source"), steps).plan()
+
+def _token(value, references):
+    """
+    Return a hashable token for `value`, by value for immutable builtin values
+    and for functions and classes importable by name, and by identity, added to
+    `references`, for anything else.
+    """
+    if value is None or isinstance(value, (bool, int, long, float, complex,
+                                           basestring)):
+        return (type(value).__name__, repr(value))
+    if type(value) is tuple:
+        return ("tuple",) + tuple(_token(v, references) for v in value)
+    if type(value) is frozenset:
+        return ("frozenset",) + tuple(sorted(_token(v, references)
+                                             for v in value))
+    if isinstance(value, Param):
+        default = () if value.default is _missing else \
+            _token(value.default, references)
+        return ("Param", value.name, default)
+    if isinstance(value, _Placeholder):
+        return ("placeholder", value.name)
+    if isinstance(value, OperationProxy):
+        source, steps = _steps(value)
+        return ("chain",) + _steps_token(source, steps, references)
+    if isinstance(value, (types.FunctionType, types.BuiltinFunctionType,
+                          types.TypeType, types.ClassType)):
+        module = sys.modules.get(getattr(value, "__module__", None))
+        if getattr(module, value.__name__, None) is value:
+            return ("name", module.__name__, value.__name__)
+    references.append(value)
+    return ("id", id(value))
+
+def _steps_token(source, steps, references, include_source=True):
+    """Return a hashable token for a chain, see :class:`ChainKey`."""
+    tokens = [_token(type(source), references)]
+    if include_source:
+        tokens.append(_token(_iterable(source), references))
+    for cls, operation in steps:
+        if operation is None:
+            tokens.append((_token(cls, references), None))
+            continue
+        name, args, kwargs = operation
+        if name == "_collapse":
+            args = (_steps_token(source, args[0], references, False),)
+        else:
+            args = _token(args, references)
+        if kwargs:
+            # Keyword arguments belong to the operation, so they are compared
+            # by value.
+            kwargs = tuple(sorted((k, _token(v, references))
+                                  for k, v in kwargs.iteritems()))
+        tokens.append((_token(cls, references), name, args, kwargs or ()))
+    return tuple(tokens)
+
+class ChainKey(object):
+    """
+    A hashable key for an operation chain, see :meth:`OperationProxy.key`.
+    Keys are equal when their chains apply the same operations with equal
+    operands, and, unless the key leaves it out, to the same source.  Builtin
+    immutable values, and functions and classes that are importable by name,
+    are compared by value; other operands and sources are compared by
+    identity, and are kept alive by the key so that their identities remain
+    unique.
+    """
+
+    __slots__ = ("tokens", "_references")
+
+    def __init__(self, tokens, references=()):
+        self.tokens = tokens
+        self._references = tuple(references)
+
+    def __hash__(self):
+        return hash(self.tokens)
+
+    def __eq__(self, other):
+        return isinstance(other, ChainKey) and self.tokens == other.tokens
+
+    def __ne__(self, other):
+        return not self == other
+
+    def fingerprint(self):
+        """
+        Return a hex digest of the key.  It is stable across processes for
+        chains whose operands and source are all compared by value.
+        """
+        import hashlib
+        return hashlib.sha1(repr(self.tokens)).hexdigest()
+
+    def __repr__(self):
+        return "ChainKey(%s)" % self.fingerprint()
+
 class IteratorProxy(object):
     """
     This is a simple proxy object for iterators, which provides a few extra
@@ -157,34 +991,84 @@ class IteratorProxy(object):
     * Concatenates iterators using the + operator. 
     * Generates a cartesian product of two iterators using the \* operator.
     * Generates a cartesian product of an iterable multiplied by itself N times using the (\* N) expression.
+    * Previews the first items without losing them, see :meth:`head`.
+
+    The cache is only allocated once a cacheable iteration runs to completion.
+    When `cacheable` is "terminal", only iterations that end at this proxy are
+    cached, and iterations that feed a later step of a chain are not.
     """
 
+    __slots__ = ("iterable", "cacheable", "_cache", "_preview", "_rest")
+
     def __init__(self, iterable, cacheable=False):
-        self._cache = []
+        self._cache = None
+        self._preview = None
+        self._rest = None
         self.cacheable = cacheable
         self.iterable = iterable
 
     def __iter__(self):
+        return self.evaluate()
+
+    def evaluate(self, terminal=False):
+        """
+        If items have been previewed with :meth:`head`, the preview is followed
+        by the rest of the iteration that produced it.  Otherwise, see
+        :meth:`iterate`.
+        """
+        if self._preview is None:
+            return self.iterate(terminal)
+        preview, rest = self._preview, self._rest
+        self._preview = self._rest = None
+        return itertools.chain(preview, rest)
+
+    def iterate(self, terminal=False):
         """
         If the underlying iterable is cacheable and the cache has been built up,
         the cache will be iterated over.  Otherwise the underlying iterable will
         be iterated over.
+
+        :parameter terminal:
+            Whether the iteration ends at this proxy, rather than feeding a
+            later step of a chain.
         """
-        if not self.cache:
-            if isinstance(self.iterable, types.FunctionType):
-                iterable = self.iterable()
-            else:
-                iterable = self.iterable
-            for item in iterable:
-                yield item
-                self.cache.append(item)
+        if self.cacheable and self._cache is not None:
+            return iter(self._cache)
+        if isinstance(self.iterable, types.FunctionType):
+            iterable = self.iterable()
         else:
-            if isinstance(self.cache, types.FunctionType):
-                iterable = self.cache()
-            else:
-                iterable = self.cache
-            for item in iterable:
-                yield item
+            iterable = self.iterable
+        if not self.cacheable or self.cacheable == "terminal" and not terminal:
+            # No need for another generator layer.
+            return iter(iterable)
+        return self._fill(iterable)
+
+    def _fill(self, iterable):
+        """
+        Iterate over `iterable`, caching the items once the iteration is
+        complete, so that an abandoned iteration never leaves a partial cache.
+        """
+        cache = []
+        for item in iterable:
+            yield item
+            cache.append(item)
+        self._cache = cache
+
+    def head(self, n, terminal=False, wrap=None):
+        """
+        Return the first `n` items.  The items, and the iteration that produced
+        them, are kept and spliced into the start of the next iteration, so
+        they are neither evaluated twice nor lost from one-shot iterables.
+        If given, `wrap` is applied to the kept items.
+        """
+        if self._preview is None:
+            self._preview, self._rest = [], self.iterate(terminal)
+        missing = n - len(self._preview)
+        if missing > 0:
+            self._preview.extend(itertools.islice(self._rest, missing))
+        if wrap is not None:
+            self._preview[:] = map(wrap, self._preview)
+        return self._preview[:n]
 
     @property
     def cache(self):
@@ -195,7 +1079,7 @@ class IteratorProxy(object):
         if not self.cacheable:
             return self.iterable
         else:
-            return self._cache
+            return self._cache or []
 
     def __getitem__(self, key):
         """
@@ -228,135 +1112,1501 @@ class IteratorProxy(object):
             return itertools.product(self, other)
 
 
-@decorator
-def chainable(f, self, *args, **kwargs):
+class _JSONReader(object):
     """
-    Chainable functions should return an instance of their class, with a
-    reference to their parent function.
-    
-    :param f:
-        The function to be decorated.
-        
-    :type f:
-        FunctionType
-        
-    :param self:
-        The chainable instance.
-        
-    :type self:
-        :class:`OperationProxy` subclass
-        
+    Incremental JSON tokenizer over a file object.  Only the unconsumed part of
+    the current chunk is buffered, plus whatever token spans the chunk boundary.
     """
-    return type(self)(f(self, *args, **kwargs), self)
 
+    _literals = {"true": True, "false": False, "null": None}
+
+    def __init__(self, fp, chunksize, owned=False):
+        self.fp = fp
+        self.chunksize = chunksize
+        self.owned = owned
+        self.buffer = ""
+        self.pos = 0
+        self.offset = 0
+        self.eof = False
+        self.root = None
+
+    def fill(self):
+        """Read another chunk, returning False at the end of the file."""
+        if self.eof:
+            return False
+        chunk = self.fp.read(self.chunksize)
+        if not chunk:
+            self.eof = True
+            return False
+        self.offset += self.pos
+        self.buffer = self.buffer[self.pos:] + chunk
+        self.pos = 0
+        return True
+
+    def error(self, expected):
+        return ValueError("Expecting %s: char %d" %
+                          (expected, self.offset + self.pos))
+
+    def peek(self):
+        """Skip whitespace and return the next character, or "" at the end."""
+        while True:
+            match = _JSON_WHITESPACE.match(self.buffer, self.pos)
+            self.pos = match.end()
+            if self.pos < len(self.buffer) or not self.fill():
+                return self.buffer[self.pos:self.pos + 1]
+
+    def expect(self, characters):
+        c = self.peek()
+        if not c or c not in characters:
+            raise self.error(" or ".join(repr(c) for c in characters))
+        self.pos += 1
+        return c
+
+    def string(self):
+        """
+        Parse a string.  The raw text of a string which spans chunks is
+        collected as each chunk is scanned for the closing quote, and decoded
+        once the whole string has been read.
+        """
+        self.expect('"')
+        start = self.offset + self.pos - 1
+        pieces = []
+        escaped = False
+        while True:
+            buffer, scan, end = self.buffer, self.pos, None
+            if escaped and scan < len(buffer):
+                # The character escaped by a backslash ending the last chunk.
+                scan += 1
+                escaped = False
+            while not escaped:
+                match = _JSON_STRING_STOP.search(buffer, scan)
+                if match is None:
+                    break
+                if match.group() == '"':
+                    end = match.end()
+                    break
+                if match.end() == len(buffer):
+                    escaped = True
+                    break
+                scan = match.end() + 1
+            if end is not None:
+                pieces.append(buffer[self.pos:end])
+                self.pos = end
+                break
+            pieces.append(buffer[self.pos:])
+            self.pos = len(buffer)
+            if not self.fill():
+                raise ValueError("Unterminated string starting at: char %d"
+                                 % start)
+        try:
+            value, _ = json.decoder.scanstring("".join(pieces), 0, "utf-8",
+                                               True)
+        except ValueError as e:
+            # Report the position in the document rather than in the string.
+            message, char = _JSON_ERROR.match(str(e)).groups()
+            raise ValueError("%s: char %d" % (message, start + 1 + int(char)))
+        return value
+
+    def value(self, parent):
+        """
+        Parse the next value, returning a leaf or a new :class:`_JSONBranch`.
+        """
+        c = self.peek()
+        if c in "[{":
+            self.pos += 1
+            return _JSONBranch(self, parent, c == "{")
+        if c == '"':
+            return self.string()
+        # Numbers and literals run up to the next delimiter, which may be in a
+        # later chunk.
+        while not _JSON_DELIMITER.search(self.buffer, self.pos) and self.fill():
+            pass
+        match = _JSON_NUMBER.match(self.buffer, self.pos)
+        if match:
+            integer, fraction, exponent = match.groups()
+            self.pos = match.end()
+            if fraction or exponent:
+                return float(integer + (fraction or "") + (exponent or ""))
+            return int(integer)
+        for word, value in self._literals.iteritems():
+            if self.buffer.startswith(word, self.pos):
+                self.pos += len(word)
+                return value
+        raise self.error("value")
+
+
+class _JSONBranch(collections.Iterator):
+    """
+    A JSON array or object that is parsed as it is iterated over.  Objects are
+    iterated over through their values, with `key` holding the key of the last
+    value.  `child` holds the last value if it was itself a branch.
+    """
 
-@decorator
-def cacheable(f, self, *args, **kwargs):
+    def __init__(self, reader, parent, mapping):
+        self.reader = reader
+        self.parent = parent
+        self.mapping = mapping
+        self.key = None
+        self.child = None
+        self.first = True
+        self.done = False
+
+    def next(self):
+        if self.done:
+            raise StopIteration
+        reader = self.reader
+        if self.child is not None:
+            # Skip over whatever wasn't consumed of the previous child.
+            for _ in self.child:
+                pass
+        close = "}" if self.mapping else "]"
+        if self.first:
+            self.first = False
+            if reader.peek() == close:
+                reader.pos += 1
+                self.finish()
+        elif reader.expect("," + close) == close:
+            self.finish()
+        if self.mapping:
+            self.key = reader.string()
+            reader.expect(":")
+        value = reader.value(self)
+        self.child = value if isinstance(value, _JSONBranch) else None
+        return value
+
+    def finish(self):
+        self.done = True
+        if self.parent is None:
+            reader = self.reader
+            # Only whitespace may follow the top level value.
+            trailing = reader.peek()
+            if reader.owned:
+                reader.fp.close()
+            if trailing:
+                raise reader.error("the end of the document")
+        raise StopIteration
+
+
+class JSONSource(object):
     """
-    :param f:
-        The function to be decorated.
-    
-    :type f:
-        FunctionType
-    
-    :param self:
-        The cacheable instance.
-        
-    :type self:
-        :class:`OperationProxy` subclass
-    
-    Cacheable functions have their return iterable wrapped in an
-    IterableProxy.  If `self`.__cacheable__ evaluates to True, the
-    IterableProxy will cache results as it is iterated over.
+    A nested structure source that parses a JSON document incrementally as it
+    is iterated over, so memory use is proportional to the nesting depth of the
+    document rather than its size.  Use it as the source of a
+    :class:`RecursiveElementwiseProxy`, and write the results out as a stream
+    with :meth:`RecursiveElementwiseProxy.dump`::
+
+        chain = RecursiveElementwiseProxy(JSONSource("input.json")) * 2
+        with open("output.json", "w") as output:
+            chain.dump(output)
+
+    Arrays and objects are branches, and objects are traversed through their
+    values.  The top level value must be an array or an object.
+
+    :parameter source:
+        A file name, or a file object.  File objects are rewound each time the
+        source is iterated over, if they support seeking.
+
+    :parameter chunksize:
+        The number of bytes to read at a time.
     """
-    iteratable = f(self, *args, **kwargs)
-    return IteratorProxy(iteratable, _cacheable(self))
 
+    def __init__(self, source, chunksize=65536):
+        self.source = source
+        self.chunksize = chunksize
+        self.start = None
+        if not isinstance(source, basestring) and hasattr(source, "tell"):
+            self.start = source.tell()
+        self.reader = None
 
-class ProxyMixin(object):
-    """Base class for Proxy Mixins."""
+    def __iter__(self):
+        owned = isinstance(self.source, basestring)
+        if owned:
+            fp = open(self.source, "rb")
+        else:
+            fp = self.source
+            if self.start is not None:
+                fp.seek(self.start)
+        self.reader = _JSONReader(fp, self.chunksize, owned)
+        if self.reader.peek() not in ("[", "{"):
+            raise self.reader.error("an array or an object")
+        mapping = self.reader.expect("[{") == "{"
+        self.reader.root = _JSONBranch(self.reader, None, mapping)
+        return self.reader.root
+
+
+def _dump_json(results, branch, fp):
+    """
+    Write `results`, the output of a recursive chain over the
+    :class:`_JSONBranch` `branch`, to `fp` as JSON.  The source is parsed in
+    lockstep with the results, so `branch` holds the key and the source branch
+    for each result as it is generated.
+    """
+    fp.write("{" if branch.mapping else "[")
+    first = True
+    for result in results:
+        if not first:
+            fp.write(", ")
+        first = False
+        if branch.mapping:
+            fp.write(json.dumps(branch.key))
+            fp.write(": ")
+        if branch.child is not None and is_branch(result):
+            _dump_json(result, branch.child, fp)
+        elif is_branch(result):
+            # A leaf which was turned into a branch by the chain.
+            json.dump(materialize(result), fp)
+        else:
+            json.dump(result, fp)
+    fp.write("}" if branch.mapping else "]")
 
 
-class ElementwiseProxyMixin(ProxyMixin):
+class CSVSource(object):
     """
-    Provides iterable objects with a proxy that broadcasts operations to member
-    elements.
+    A record source that reads a CSV file as it is iterated over, generating a
+    dict per row, keyed by the field names in the header row.  As with
+    csv.DictReader, blank lines are skipped and the fields missing from short
+    rows are None::
+
+        rows = ElementwiseProxy(CSVSource("orders.csv", types={"price": float}))
+        prices = rows.item["price"].where(rows.item["qty"] != "0")
+
+    Only the fields a chain reads are decoded: when the first step of a chain
+    over the source takes items of the rows (see :attr:`OperationProxy.item`),
+    or a :class:`RecordProxy` is built from it with `fields`, the source is
+    projected on those fields with :meth:`project`.  Filters and selections
+    between chains over the source, such as `prices` above, read it once,
+    projected on the union of the fields their chains read.  Separate chains,
+    such as the operands of pairwise operations, each read the source again.
+
+    :parameter source:
+        A file name, or a file object.  File objects are rewound each time the
+        source is iterated over, if they support seeking.
+
+    :parameter fields:
+        The fields to decode, defaulting to every field of the header.
+
+    :parameter types:
+        A mapping of field names to the functions which convert their text,
+        such as float.  Other fields are left as strings.
+
+    :parameter fmtparams:
+        Formatting parameters for csv.reader, such as delimiter.
     """
 
-    @property
-    def each(self):
-        """Syntactic sugar for ElementwiseProxy(self)"""
-        parent = isinstance(self, OperationProxy) and self or None
-        return ElementwiseProxy(self, parent)
+    def __init__(self, source, fields=None, types=None, **fmtparams):
+        self.source = source
+        self.fields = None if fields is None else tuple(fields)
+        self.types = dict(types or {})
+        self.fmtparams = fmtparams
+        self.start = None
+        if not isinstance(source, basestring) and hasattr(source, "tell"):
+            self.start = source.tell()
+
+    def project(self, fields):
+        """
+        Return a source which decodes only `fields`, in that order.
+        """
+        fields = tuple(fields)
+        if self.fields is not None:
+            missing = [f for f in fields if f not in self.fields]
+            if missing:
+                raise KeyError("The fields %r are not in this source" %
+                               (missing,))
+        source = CSVSource(self.source, fields, self.types, **self.fmtparams)
+        source.start = self.start
+        return source
+
+    def __iter__(self):
+        owned = isinstance(self.source, basestring)
+        if owned:
+            fp = open(self.source, "rb")
+        else:
+            fp = self.source
+            if self.start is not None:
+                fp.seek(self.start)
+        try:
+            reader = csv.reader(fp, **self.fmtparams)
+            header = next(reader, [])
+            if not header:
+                # An empty file has no rows.
+                return
+            fields = self.fields
+            if fields is None:
+                fields = tuple(header)
+            try:
+                getter = _itemgetter(tuple(header.index(f) for f in fields))
+            except ValueError:
+                raise KeyError("The fields %r are not all in the header %r"
+                               % (fields, header))
+            converters = [(i, self.types[f]) for i, f in enumerate(fields)
+                          if f in self.types]
+            izip = itertools.izip
+            width = len(header)
+            padding = [None] * width
+            for row in reader:
+                if not row:
+                    # Blank lines are skipped, as by csv.DictReader.
+                    continue
+                if len(row) < width:
+                    # Missing fields are None, as with csv.DictReader.
+                    row += padding[len(row):]
+                values = getter(row)
+                if converters:
+                    values = list(values)
+                    for i, convert in converters:
+                        if values[i] is not None:
+                            values[i] = convert(values[i])
+                yield dict(izip(fields, values))
+        finally:
+            if owned:
+                fp.close()
 
+    def __repr__(self):
+        return "CSVSource(%r, fields=%r)" % (self.source, self.fields)
 
-class RecursiveElementwiseProxyMixin(ProxyMixin):
+
+def _project(iterable, key):
     """
-    Provides iterable objects with a proxy that broadcasts operations
-    recursively to member elements.
+    Return `iterable` projected on the fields in `key`, a field or a tuple of
+    fields, if it is a record source which supports projection (see
+    :meth:`CSVSource.project`), or `iterable` itself otherwise.
     """
+    if not isinstance(iterable, CSVSource):
+        return iterable
+    fields = key if isinstance(key, tuple) else (key,)
+    if not all(isinstance(f, basestring) for f in fields):
+        return iterable
+    return iterable.project(fields)
 
-    @property
-    def recurse(self):
-        """Syntactic sugar for RecursiveElementwiseProxy(self)"""
-        parent = isinstance(self, OperationProxy) and self or None
-        return RecursiveElementwiseProxy(self, parent)
+
+def _read_fields(steps):
+    """
+    Return the fields of the records that `steps`, a chain's (proxy type,
+    operation) pairs, read from a record source, or None if they read whole
+    records.  The steps read the fields of their first item step, unless a
+    later filter (see :meth:`OperationProxy.where`) reads the source again, in
+    which case they read the fields of the filter's predicates and of the
+    steps it filters.
+    """
+    for i in reversed(range(len(steps))):
+        operation = steps[i][1]
+        if operation is not None and operation[0] == "_where" and \
+                operation[1][0] == i:
+            predicates = operation[1][1]
+            if not isinstance(predicates, tuple):
+                predicates = (predicates,)
+            return _union_fields(_read_fields(steps[:i]), *[
+                _read_fields(_steps(p)[1]) for p in predicates])
+    for cls, operation in steps:
+        if operation is None:
+            continue
+        if operation[0] != "_item" or issubclass(cls,
+                                                 RecursiveElementwiseProxy):
+            return None
+        key = operation[1][0]
+        fields = key if isinstance(key, tuple) else (key,)
+        if not all(isinstance(f, basestring) for f in fields):
+            return None
+        return fields
+    return None
+
+def _union_fields(*fields):
+    """
+    Return the union of the tuples of fields in `fields`, in order, or None if
+    any of them is None.
+    """
+    if any(f is None for f in fields):
+        return None
+    union = []
+    for f in itertools.chain.from_iterable(fields):
+        if f not in union:
+            union.append(f)
+    return tuple(union)
 
 
-class PairwiseProxyMixin(ProxyMixin):
+def _source_stamp(source):
     """
-    Provides iterable objects with a proxy that performs pairwise operations
-    using elements of supplied iterables.
+    Return a stamp which changes whenever the content of `source` does: the
+    path, modification time and size of file sources, or a digest of the
+    pickled content of collections.  The stamps of record and document
+    sources also hold the parameters they decode the file with.  Returns None
+    for anything else, such as one-shot iterators, whose content can not be
+    examined without consuming it, and for sources decoded by functions that
+    are not importable by name.
+    """
+    decoding = ()
+    if isinstance(source, CSVSource):
+        references = []
+        decoding = ("csv", _token(source.fields, references),
+                     tuple(sorted((f, _token(t, references))
+                                  for f, t in source.types.iteritems())),
+                     tuple(sorted((k, _token(v, references))
+                                  for k, v in source.fmtparams.iteritems())),
+                     source.start)
+        if references:
+            return None
+        source = source.source
+    elif isinstance(source, JSONSource):
+        decoding = ("json", source.start)
+        source = source.source
+    path = source if isinstance(source, basestring) else None
+    if isinstance(source, file):
+        path = source.name
+    if path is not None and os.path.isfile(path):
+        stat = os.stat(path)
+        return ("file", os.path.abspath(path), stat.st_mtime, stat.st_size,
+                decoding)
+    if isinstance(source, (collections.Sequence, collections.Mapping,
+                           collections.Set)):
+        import cPickle
+        import hashlib
+        try:
+            content = cPickle.dumps(source, 2)
+        except (cPickle.PicklingError, TypeError):
+            return None
+        return ("content", hashlib.sha1(content).hexdigest())
+    return None
+
+
+class ResultCache(object):
+    """
+    A directory of pickled chain results, shared between processes, see
+    :meth:`OperationProxy.persist`.  Once the results in the directory take up
+    more than `max_size` bytes, the least recently used are removed.
+
+    :parameter directory:
+        The cache directory, which is created if it does not exist.
+
+    :parameter max_size:
+        The maximum total size of the cached results, in bytes.
     """
 
+    suffix = ".pickle"
+
+    def __init__(self, directory, max_size=2 ** 30):
+        self.directory = directory
+        self.max_size = max_size
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+
+    def _path(self, key):
+        return os.path.join(self.directory, key + self.suffix)
+
+    def get(self, key):
+        """Return the results stored under `key`, or None."""
+        import cPickle
+        path = self._path(key)
+        try:
+            with open(path, "rb") as f:
+                values = cPickle.load(f)
+            # The modification time records the last use.
+            os.utime(path, None)
+        except (IOError, OSError):
+            return None
+        except Exception:
+            # A damaged entry.
+            self.discard(key)
+            return None
+        return values
+
+    def put(self, key, values):
+        """Store `values` under `key`, then evict entries if needed."""
+        import cPickle
+        import tempfile
+        fd, temporary = tempfile.mkstemp(dir=self.directory)
+        try:
+            with os.fdopen(fd, "wb") as f:
+                cPickle.dump(values, f, 2)
+            os.rename(temporary, self._path(key))
+        except Exception:
+            os.remove(temporary)
+            raise
+        self.evict()
+
+    def discard(self, key):
+        """Remove the results stored under `key`, if there are any."""
+        try:
+            os.remove(self._path(key))
+        except OSError:
+            pass
+
+    def evict(self):
+        """Remove the least recently used results until within max_size."""
+        entries = []
+        for name in os.listdir(self.directory):
+            if not name.endswith(self.suffix):
+                continue
+            try:
+                stat = os.stat(os.path.join(self.directory, name))
+            except OSError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, name))
+        total = sum(size for mtime, size, name in entries)
+        for mtime, size, name in sorted(entries):
+            if total <= self.max_size:
+                break
+            self.discard(name[:-len(self.suffix)])
+            total -= size
+
+
+class Memo(object):
+    """
+    An unbounded memo of the results of a function by element value, for
+    :meth:`OperationProxy.apply`.  Elements are keyed by type as well as value,
+    so that 1, 1.0 and True are kept apart.  Elements which are not hashable
+    are passed to the function every time.  A memo can be shared by several
+    steps, whose results are kept apart, and by several threads.
+
+    :ivar hits:
+        The number of results served from the memo.
+
+    :ivar misses:
+        The number of results computed and stored in the memo.
+    """
+
+    def __init__(self):
+        self.hits = self.misses = 0
+        self._tables = {}
+        self._lock = threading.Lock()
+
     @property
-    def pair(self):
-        """Syntactic sugar for PairwiseProxy(self)"""
-        parent = isinstance(self, OperationProxy) and self or None
-        return RecursiveElementwiseProxy(self, parent)
+    def hit_rate(self):
+        """The fraction of lookups served from the memo."""
+        lookups = self.hits + self.misses
+        return float(self.hits) / lookups if lookups else 0.0
+
+    def clear(self):
+        """Forget all results, and reset the counts."""
+        # The tables are cleared in place, since the steps which share them
+        # hold on to them.
+        with self._lock:
+            for table in self._tables.itervalues():
+                table.clear()
+            self.hits = self.misses = 0
+
+    def wrap(self, function, signature):
+        """
+        Return a memoized version of `function`, which computes the results of
+        the step identified by the hashable `signature`.
+        """
+        table = self._tables.setdefault(signature, {})
+        lock = self._lock
+        def memoized(e):
+            key = (type(e), e)
+            try:
+                value = table[key]
+            except KeyError:
+                value = table[key] = function(e)
+                with lock:
+                    self.misses += 1
+                return value
+            except TypeError:
+                return function(e)
+            with lock:
+                self.hits += 1
+            return value
+        return memoized
+
+    def __repr__(self):
+        return "%s(hits=%d, misses=%d, hit_rate=%.3f)" % (
+            type(self).__name__, self.hits, self.misses, self.hit_rate)
 
+    def __reduce__(self):
+        # The results are not pickled.
+        return type(self), ()
 
-class OperationProxy(object):
+
+class LRU(Memo):
     """
-    Base class for Proxy objects.
+    A memo which keeps the results of the `maxsize` most recently used
+    elements, see :class:`Memo`.
     """
 
-    def __init__(self, iterable=tuple(), parent=None):
-        self.iterable = iterable
-        self.parent = parent
+    def __init__(self, maxsize=128):
+        Memo.__init__(self)
+        self.maxsize = maxsize
+        self._cache = {}
+        # A circular doubly linked list of [previous, next, key, value] links,
+        # from the least to the most recently used.
+        self._root = root = []
+        root[:] = [root, root, None, None]
+
+    def clear(self):
+        root = self._root
+        with self._lock:
+            self._cache.clear()
+            root[:] = [root, root, None, None]
+            self.hits = self.misses = 0
+
+    def wrap(self, function, signature):
+        tag = self._tables.setdefault(signature, len(self._tables))
+        cache, root, lock, maxsize = (self._cache, self._root, self._lock,
+                                      self.maxsize)
+        def memoized(e):
+            key = (tag, type(e), e)
+            try:
+                hash(key)
+            except TypeError:
+                return function(e)
+            with lock:
+                link = cache.get(key)
+                if link is not None:
+                    previous, following, _, value = link
+                    previous[1] = following
+                    following[0] = previous
+                    last = root[0]
+                    last[1] = root[0] = link
+                    link[0] = last
+                    link[1] = root
+                    self.hits += 1
+                    return value
+            value = function(e)
+            with lock:
+                self.misses += 1
+                if key in cache or maxsize <= 0:
+                    return value
+                if len(cache) >= maxsize:
+                    oldest = root[1]
+                    root[1] = oldest[1]
+                    oldest[1][0] = root
+                    del cache[oldest[2]]
+                last = root[0]
+                last[1] = root[0] = cache[key] = [last, root, key, value]
+            return value
+        return memoized
 
-    def replicate(self, iterable):
-        """
-        Creates a copy of this operation chain, with `iterable` as the source.
-        """
-        def ancestors():
-            current = self
-            while current is not None:
-                yield current
-                current = object.__getattribute__(current, "parent")
-        ancestor_list = list(ancestors())
-        parent = type(ancestor_list[-1])(iterable)
-        for ancestor in reversed(ancestor_list[:-1]):
-            # Every ancester after the first will have an IteratorProxy that
-            # wraps a function.
-            iterable = object.__getattribute__(ancestor, "iterable").iterable
-            # The only thing we need to do is get the "self" name in the closure
-            # to point to the new OperationProxy.
-            new_closure = (create_cell(parent),) + iterable.func_closure[1:]
-            new_iterable = copy_func(iterable, closure=new_closure)
-            iterator_proxy = IteratorProxy(new_iterable, _cacheable(self))
-            # Here we build up the chain.
-            new_ancestor = type(ancestor)(iterator_proxy, parent)
-            parent = new_ancestor
-        # Now return parent, which is a copy of this, with references to copies
-        # of all chain members.
-        return parent
+    def __repr__(self):
+        return "LRU(%d, hits=%d, misses=%d, hit_rate=%.3f)" % (
+            self.maxsize, self.hits, self.misses, self.hit_rate)
 
-    def undo(self, steps=1):
-        """
-        Starting from the current operation, undo the previous `steps`
-        operations in the chain.
-        
+    def __reduce__(self):
+        return LRU, (self.maxsize,)
+
+
+def _memoize(memo, func, args, kwargs):
+    """
+    Return the function computing func(e, *args, **kwargs), memoized in
+    `memo`, see :meth:`OperationProxy.apply`.
+    """
+    if args or kwargs:
+        function = lambda e: func(e, *args, **kwargs)
+    else:
+        function = func
+    signature = (func, args, tuple(sorted(kwargs.items())))
+    try:
+        hash(signature)
+    except TypeError:
+        # Steps with unhashable arguments do not share results.
+        signature = (func, id(function))
+    return memo.wrap(function, signature)
+
+
+def _batches(func, size, iterable):
+    """
+    Generate the results of func over lists of up to `size` consecutive
+    elements of `iterable`, one sequence per batch, see
+    :meth:`OperationProxy.apply_batch`.
+    """
+    iterator = iter(iterable)
+    islice = itertools.islice
+    while True:
+        batch = list(islice(iterator, size))
+        if not batch:
+            return
+        results = func(batch)
+        if not isinstance(results, collections.Sized):
+            results = list(results)
+        if len(results) != len(batch):
+            raise ValueError("%r returned %d results for a batch of %d elements"
+                             % (func, len(results), len(batch)))
+        yield results
+
+
+def ipow(x, y, modulo=None):
+    """In place power, with the optional modulo of pow."""
+    if modulo is None:
+        return operator.ipow(x, y)
+    return pow(x, y, modulo)
+
+
+# The operator table: (method name, function, expression, reflected).  The
+# function is applied to each element followed by the operands, or to the
+# operand followed by each element if the operator is reflected.  The
+# expression describes the same operation, with the element as {0} and the
+# operands as {1} and {2}.  Every proxy class gets one method per operator.
+# The operator module functions already go straight to the type slots, so
+# resolving a slot such as float.__add__ per type would not be faster: the
+# slot wrappers cost as much or more per call than operator.add, and
+# checking the element types costs extra.
+_operators = (
+    ("__hash__", hash, "hash({0})", False),
+    ("__invert__", operator.invert, "~{0}", False),
+    ("__index__", operator.index, "operator.index({0})", False),
+    ("__neg__", operator.neg, "-{0}", False),
+    ("__pos__", operator.pos, "+{0}", False),
+    ("__abs__", abs, "abs({0})", False),
+    ("__add__", operator.add, "{0} + {1}", False),
+    ("__sub__", operator.sub, "{0} - {1}", False),
+    ("__mul__", operator.mul, "{0} * {1}", False),
+    ("__floordiv__", operator.floordiv, "{0} // {1}", False),
+    ("__mod__", operator.mod, "{0} % {1}", False),
+    ("__divmod__", divmod, "divmod({0}, {1})", False),
+    ("__pow__", pow, "pow({0}, {1}, {2})", False),
+    ("__lshift__", operator.lshift, "{0} << {1}", False),
+    ("__rshift__", operator.rshift, "{0} >> {1}", False),
+    ("__div__", operator.div, "{0} / {1}", False),
+    ("__truediv__", operator.truediv, "operator.truediv({0}, {1})", False),
+    ("__and__", operator.and_, "{0} & {1}", False),
+    ("__xor__", operator.xor, "{0} ^ {1}", False),
+    ("__or__", operator.or_, "{0} | {1}", False),
+    ("__radd__", operator.add, "{1} + {0}", True),
+    ("__rsub__", operator.sub, "{1} - {0}", True),
+    ("__rmul__", operator.mul, "{1} * {0}", True),
+    ("__rfloordiv__", operator.floordiv, "{1} // {0}", True),
+    ("__rmod__", operator.mod, "{1} % {0}", True),
+    ("__rdivmod__", divmod, "divmod({1}, {0})", True),
+    ("__rpow__", pow, "pow({1}, {0})", True),
+    ("__rlshift__", operator.lshift, "{1} << {0}", True),
+    ("__rrshift__", operator.rshift, "{1} >> {0}", True),
+    ("__rdiv__", operator.div, "{1} / {0}", True),
+    ("__rtruediv__", operator.truediv, "operator.truediv({1}, {0})", True),
+    ("__rand__", operator.and_, "{1} & {0}", True),
+    ("__rxor__", operator.xor, "{1} ^ {0}", True),
+    ("__ror__", operator.or_, "{1} | {0}", True),
+    ("__contains__", operator.contains, "{1} in {0}", False),
+    ("__eq__", operator.eq, "{0} == {1}", False),
+    ("__ne__", operator.ne, "{0} != {1}", False),
+    ("__le__", operator.le, "{0} <= {1}", False),
+    ("__lt__", operator.lt, "{0} < {1}", False),
+    ("__gt__", operator.gt, "{0} > {1}", False),
+    ("__ge__", operator.ge, "{0} >= {1}", False),
+    ("__cmp__", cmp, "cmp({0}, {1})", False),
+    ("__iadd__", operator.iadd, "operator.iadd({0}, {1})", False),
+    ("__isub__", operator.isub, "operator.isub({0}, {1})", False),
+    ("__imul__", operator.imul, "operator.imul({0}, {1})", False),
+    ("__ifloordiv__", operator.ifloordiv, "operator.ifloordiv({0}, {1})", False),
+    ("__imod__", operator.imod, "operator.imod({0}, {1})", False),
+    ("__ipow__", ipow, "ipow({0}, {1}, {2})", False),
+    ("__ilshift__", operator.ilshift, "operator.ilshift({0}, {1})", False),
+    ("__irshift__", operator.irshift, "operator.irshift({0}, {1})", False),
+    ("__idiv__", operator.idiv, "operator.idiv({0}, {1})", False),
+    ("__itruediv__", operator.itruediv, "operator.itruediv({0}, {1})", False),
+    ("__iand__", operator.iand, "operator.iand({0}, {1})", False),
+    ("__ixor__", operator.ixor, "operator.ixor({0}, {1})", False),
+    ("__ior__", operator.ior, "operator.ior({0}, {1})", False),
+)
+
+_operator_doc = """
+        :returns:
+            A proxy which generates::
+
+                %s
+"""
+
+_inplace_warning = """
+        .. warning::
+
+            For mutable types, this operations can not be undone once finalized.
+"""
+
+
+def _operator_method(cls, name, function, expression, reflected):
+    """
+    Build the method `name` of the proxy class `cls` from its entry in the
+    operator table.
+    """
+    if "{2}" in expression:
+        def method(self, other, modulo=None):
+            operands = (other, modulo)
+            if isinstance(other, Param) or isinstance(modulo, Param):
+                stage = _parameterize(self._map, function, operands, reflected)
+            else:
+                stage = self._map(function, operands, reflected)
+            return self._chain(stage, (name, operands, None))
+    elif "{1}" in expression:
+        def method(self, other):
+            operands = (other,)
+            if isinstance(other, Param):
+                stage = _parameterize(self._map, function, operands, reflected)
+            else:
+                stage = self._map(function, operands, reflected)
+            return self._chain(stage, (name, operands, None))
+    else:
+        def method(self):
+            return self._chain(self._map(function), (name, (), None))
+    method.__name__ = name
+    method.__doc__ = _operator_doc % (
+        cls._expression % expression.format("e", "other", "modulo"))
+    if name.startswith("__i") and name not in ("__invert__", "__index__"):
+        method.__doc__ += _inplace_warning
+    return method
+
+
+def operator_methods(cls):
+    """
+    Class decorator which adds a method for every operator in the operator
+    table to the proxy class `cls`.
+    """
+    for name, function, expression, reflected in _operators:
+        setattr(cls, name,
+                _operator_method(cls, name, function, expression, reflected))
+    return cls
+
+
+# Expression templates of the operators, for fusing steps into kernels.
+_expressions = dict((name, expression)
+                    for name, function, expression, reflected in _operators)
+
+# The steps which generate one result per input element, in order, so that a
+# mask computed before them still lines up with their results, see
+# OperationProxy.where.
+_one_to_one = frozenset(list(_expressions) + [
+    "__getattr__", "__call__", "_call_method", "_item", "apply", "apply_batch",
+    "checkpoint", "persist"])
+
+def _shared_step(proxy, other):
+    """
+    Return the latest step shared by the chains ending in `proxy` and `other`,
+    its distance from `proxy` in steps, and the steps leading from it to
+    `other`, or None if the chains do not share a source.
+    """
+    depths = {}
+    depth, current = 0, proxy
+    while True:
+        depths[id(current)] = depth, current
+        parent = _parent(current)
+        if parent is None:
+            break
+        depth, current = depth + 1, parent
+    steps = []
+    while id(other) not in depths:
+        parent = _parent(other)
+        if parent is None:
+            # Separate proxies over the same source object share it.
+            if _iterable(other) is not _iterable(current):
+                return None
+            break
+        steps.append((type(other), _operation(other)))
+        other = parent
+    else:
+        depth, current = depths[id(other)]
+    steps.reverse()
+    return current, depth, tuple(steps)
+
+def _pushdown(steps):
+    """
+    Return whether a filter can be applied before `steps` rather than to their
+    results, see :meth:`OperationProxy.where`.  Raises ValueError if the steps
+    do not generate one result per element.
+    """
+    for cls, operation in steps:
+        if operation is None:
+            continue
+        if operation[0] not in _one_to_one:
+            raise ValueError("A mask can not be lined up with the results of "
+                             "a %r step" % (operation[0],))
+        if issubclass(cls, RecursiveElementwiseProxy):
+            # Recursive steps generate branches rather than single results.
+            raise ValueError("A mask can not be lined up with the results of "
+                             "a recursive %r step" % (operation[0],))
+    # Pairwise operands are lined up with every element, and cached results
+    # are kept by source, so these steps must see every element.
+    return all(not issubclass(cls, PairwiseProxy) and (operation is None or
+               operation[0] not in ("checkpoint", "persist"))
+               for cls, operation in steps)
+
+# Compiled kernels by key, see _kernel.
+_kernels = {}
+
+def _identifier(name):
+    """
+    Whether `name` can be spelled as an attribute in a kernel, which keywords
+    such as "from" can not, even though getattr accepts them.
+    """
+    return bool(_IDENTIFIER.match(name)) and not keyword.iskeyword(name)
+
+def _fusible(proxy):
+    """
+    Return the expression template and the constants of the step `proxy`, if
+    it can be fused with its neighbours into a kernel.  The element is {0} in
+    the template, and the constants are {1} onwards.
+    """
+    if not isinstance(proxy, ElementwiseProxy):
+        return None
+    name, args, kwargs = _operation(proxy)
+    if _parameterized(args) or _parameterized(kwargs or {}):
+        return None
+    if name in _expressions:
+        return _expressions[name], args
+    if name == "__getattr__" and _identifier(args[0]):
+        return "{0}.%s" % args[0], ()
+    if name == "apply":
+        if kwargs and kwargs.get("memo") is not None:
+            kwargs = dict(kwargs)
+            memo = kwargs.pop("memo")
+            return "{1}({0})", (_memoize(memo, args[0], args[1:], kwargs),)
+        if len(args) == 1 and not kwargs:
+            return "{1}({0})", args
+        return "{1}({0}, *{2}, **{3})", (args[0], args[1:], kwargs or {})
+    if name == "__call__":
+        return "{0}(*{1}, **{2})", (args, kwargs or {})
+    if name == "_item":
+        key = args[0]
+        if isinstance(key, tuple):
+            if _parameterized(key):
+                return None
+            return "{1}({0})", (_itemgetter(key),)
+        return "{0}[{1}]", args
+    if name == "_call_method" and _identifier(args[0]):
+        name, args, items = args
+        kwargs = dict(items)
+        if _parameterized(args) or _parameterized(kwargs):
+            return None
+        if not args and not kwargs:
+            return "{0}.%s()" % name, ()
+        return "{0}.%s(*{1}, **{2})" % name, (args, kwargs)
+    return None
+
+def _kernel(source):
+    """
+    Return the kernel function defined by `source`, compiling it, or loading
+    it from the kernel cache directory if it has been compiled before.
+    """
+    import hashlib
+    import imp
+    key = hashlib.sha1(
+        "\0".join((source, __version__, imp.get_magic()))).hexdigest()
+    kernel = _kernels.get(key)
+    if kernel is not None:
+        return kernel
+    code = None
+    if kernel_cache is not None:
+        path = os.path.join(kernel_cache, key + ".marshal")
+        try:
+            with open(path, "rb") as f:
+                code = marshal.loads(f.read())
+        except (IOError, EOFError, ValueError, TypeError):
+            code = None
+    if not isinstance(code, types.CodeType):
+        code = compile(source, "<elementwise kernel>", "exec", 0, True)
+        if kernel_cache is not None:
+            _store_kernel(path, code)
+    namespace = {"operator": operator, "ipow": ipow}
+    exec code in namespace
+    kernel = _kernels[key] = namespace["kernel"]
+    return kernel
+
+def _store_kernel(path, code):
+    """Write `code` to `path`, atomically and ignoring errors."""
+    import tempfile
+    try:
+        if not os.path.isdir(os.path.dirname(path)):
+            os.makedirs(os.path.dirname(path))
+        fd, temporary = tempfile.mkstemp(dir=os.path.dirname(path))
+        with os.fdopen(fd, "wb") as f:
+            f.write(marshal.dumps(code))
+        os.rename(temporary, path)
+    except (IOError, OSError):
+        pass
+
+def _fuse(run):
+    """
+    Fuse a run of (template, constants) steps into a single stage, which is
+    a generated generator function.
+    """
+    expression, constants = "e", []
+    for template, values in run:
+        names = ["c%d" % (len(constants) + i) for i in range(len(values))]
+        expression = "(%s)" % template.format(expression, *names)
+        constants.extend(values)
+    # Resuming a generator is cheaper than calling a function per element.
+    source = ("def kernel(%s):\n"
+              "    def run(iterable, source, params):\n"
+              "        for e in iterable:\n"
+              "            yield %s\n"
+              "    return run\n") % (
+        ", ".join("c%d" % i for i in range(len(constants))), expression)
+    return _kernel(source)(*constants)
+
+def _fused_stages(proxy):
+    """
+    Like :func:`_stages`, except that consecutive elementwise operator,
+    attribute, call and apply steps are fused into kernels.
+    """
+    steps, first = [], None
+    parent = _parent(proxy)
+    while parent is not None:
+        stage = _stage(proxy)
+        if stage is not None:
+            steps.append((stage, _fusible(proxy)))
+            first = proxy
+        proxy, parent = parent, _parent(parent)
+    steps.reverse()
+    stages, run = [], []
+    for stage, fusible in steps + [(None, None)]:
+        if fusible is not None:
+            run.append((stage, fusible))
+            continue
+        if len(run) > 1:
+            stages.append(_fuse([f for s, f in run]))
+        else:
+            stages.extend(s for s, f in run)
+        run = []
+        if stage is not None:
+            stages.append(stage)
+    if (first is not None and stages[0] is not _stage(first) and
+            _operation(first)[0] == "_item" and
+            not isinstance(first, RecursiveElementwiseProxy)):
+        # The item step projects record sources itself, unless it was fused.
+        key = _operation(first)[1][0]
+        stages.insert(0, lambda iterable, source, params: _project(iterable,
+                                                                   key))
+    return tuple(stages)
+
+
+class Plan(object):
+    """
+    An immutable, compiled operation chain, created by
+    :meth:`OperationProxy.plan`.  Calling a plan with a source returns an
+    iterator over the results of the chain for that source; nothing is
+    evaluated until the iterator is advanced, and no proxies are created.
+
+    Plans created from a chain can be pickled, under the same conditions as
+    the chain itself.
+
+    .. note::
+
+        Operands which are one-shot iterators, such as the arguments of
+        pairwise operations, are shared by every evaluation of the plan.
+    """
+
+    __slots__ = ("_stages", "_recursive", "_chain")
+
+    def __init__(self, stages, recursive=False, chain=None):
+        object.__setattr__(self, "_stages", tuple(stages))
+        object.__setattr__(self, "_recursive", recursive)
+        # The source type and steps of the chain, for pickling.
+        object.__setattr__(self, "_chain", chain)
+
+    def __setattr__(self, name, value):
+        raise AttributeError("Plans are immutable")
+
+    def __reduce__(self):
+        if self._chain is None:
+            raise TypeError("Only plans created from a chain can be pickled")
+        return _restore_plan, self._chain
+
+    def _compose(self, source, params):
+        iterable = source
+        for stage in self._stages:
+            iterable = stage(iterable, source, params)
+        yield iterable
+
+    def __call__(self, source, **params):
+        """
+        Return an iterator over the results of the plan for `source`, with the
+        values of its :class:`Param` parameters given by keyword.
+        """
+        # Composing the stages is deferred to the first item.
+        return itertools.chain.from_iterable(self._compose(source, params))
+
+    def _evaluate(self, source, params=None):
+        results = self(source, **(params or {}))
+        if self._recursive:
+            return materialize(results)
+        return list(results)
+
+    def map(self, sources, workers=None, executor=None, params=None):
+        """
+        Evaluate the plan over each of `sources`.
+
+        :parameter params:
+            The values of the plan's :class:`Param` parameters, as a mapping.
+
+        :parameter workers:
+            The number of workers, defaulting to the number of CPUs.
+
+        :parameter executor:
+            None evaluates the sources in turn, "thread" on a pool of threads,
+            and "process" on a forked process pool, which inherits the plan
+            and sources so that only the results are pickled.
+
+        :returns:
+            The results for each source, as lists, or as nested tuples for
+            recursive plans.
+
+        :rtype:
+            list
+        """
+        evaluate = functools.partial(self._evaluate, params=params)
+        if executor is None:
+            return [evaluate(source) for source in sources]
+        global _parallel_state
+        # multiprocessing is slow to import, and only needed here.
+        import multiprocessing
+        import multiprocessing.pool
+        if executor == "thread":
+            pool = multiprocessing.pool.ThreadPool(workers)
+            try:
+                return pool.map(evaluate, sources)
+            finally:
+                pool.terminate()
+        elif executor == "process":
+            sources = list(sources)
+            _parallel_state = (evaluate, sources)
+            pool = multiprocessing.Pool(workers)
+            try:
+                return pool.map(_plan_task, range(len(sources)))
+            finally:
+                pool.terminate()
+                _parallel_state = None
+        raise ValueError("Unknown executor %r" % executor)
+
+
+class ProxyMixin(object):
+    """Base class for Proxy Mixins."""
+
+    __slots__ = ()
+
+
+class ElementwiseProxyMixin(ProxyMixin):
+    """
+    Provides iterable objects with a proxy that broadcasts operations to member
+    elements.
+    """
+
+    __slots__ = ()
+
+    @property
+    def each(self):
+        """Syntactic sugar for ElementwiseProxy(self)"""
+        parent = isinstance(self, OperationProxy) and self or None
+        return ElementwiseProxy(self, parent)
+
+
+class RecursiveElementwiseProxyMixin(ProxyMixin):
+    """
+    Provides iterable objects with a proxy that broadcasts operations
+    recursively to member elements.
+    """
+
+    __slots__ = ()
+
+    @property
+    def recurse(self):
+        """Syntactic sugar for RecursiveElementwiseProxy(self)"""
+        parent = isinstance(self, OperationProxy) and self or None
+        return RecursiveElementwiseProxy(self, parent)
+
+
+class PairwiseProxyMixin(ProxyMixin):
+    """
+    Provides iterable objects with a proxy that performs pairwise operations
+    using elements of supplied iterables.
+    """
+
+    __slots__ = ()
+
+    @property
+    def pair(self):
+        """Syntactic sugar for PairwiseProxy(self)"""
+        parent = isinstance(self, OperationProxy) and self or None
+        return RecursiveElementwiseProxy(self, parent)
+
+
+class OperationProxy(object):
+    """
+    Base class for Proxy objects.
+
+    Every step in a chain is a proxy whose `iterable` is an
+    :class:`IteratorProxy` over the step's results, and whose `operation`
+    records how the step was created, as a (method name, args, kwargs) tuple,
+    so that it can be replayed on another parent.  The source of a chain, and
+    the proxies created by the mutators, have no operation.
+
+    Proxies have no instance dictionary; their state is kept in slots, which
+    are read with the slot accessors (_iterable, _parent and _operation) so
+    that a missing value never falls through to the broadcasting
+    :meth:`__getattr__`.
+
+    Two policies control how much of a chain is kept in memory, and can be set
+    on a proxy or, as class-level defaults, on a subclass.  Setting
+    `__cacheable__` to True on a proxy caches the results of the steps created
+    from it, while setting it to "terminal" caches only the results of the
+    step that is actually iterated over, for the proxy and every step built on
+    it.  Setting `__weakparents__` to True makes every step built on a proxy
+    hold a weak reference to its parent, so that ancestors are released once
+    nothing else refers to them; :meth:`undo` and :meth:`replicate` then raise
+    ReferenceError if they need a released step.  See also :meth:`detach` and
+    :meth:`checkpoint`.
+    """
+
+    __slots__ = ("iterable", "parent", "operation", "_stage",
+                 "_cacheable_policy", "_weakparents_policy", "__weakref__")
+
+    def __init__(self, iterable=tuple(), parent=None, operation=None,
+                 stage=None):
+        if not isinstance(iterable, (IteratorProxy, OperationProxy)) and \
+           isinstance(iterable, collections.Iterator):
+            # One-shot sources need an IteratorProxy to be previewed safely.
+            iterable = IteratorProxy(iterable)
+        # None falls back to the class-level policy, see _cacheable.
+        self._cacheable_policy = None
+        self._weakparents_policy = None
+        if parent is not None:
+            # Memory policies apply to the whole chain built on a proxy.
+            if _cacheable(parent) == "terminal":
+                self._cacheable_policy = "terminal"
+            if _weakparents(parent):
+                self._weakparents_policy = True
+                parent = weakref.ref(parent)
+        self.iterable = iterable
+        self.parent = parent
+        self.operation = operation
+        self._stage = stage
+
+    @property
+    def __cacheable__(self):
+        return _cacheable_policy(self) or False
+
+    @__cacheable__.setter
+    def __cacheable__(self, value):
+        self._cacheable_policy = value
+
+    @property
+    def __weakparents__(self):
+        return _weakparents_policy(self) or False
+
+    @__weakparents__.setter
+    def __weakparents__(self, value):
+        self._weakparents_policy = value
+
+    @staticmethod
+    def _map(function, operands=(), reflected=False):
+        """
+        Return a stage which generates the results of applying `function` to
+        the elements of an iterable with `operands`, see the operator table.
+        Subclasses define how the elements are paired with the operands.
+        """
+        raise NotImplementedError
+
+    def _chain(self, stage, operation, source=None, cls=None):
+        """
+        Create the next step of the chain, of type `cls` (by default the type
+        of this proxy).  A stage is a function of this proxy's results and the
+        source of the chain, returning the results of the step; only stages
+        that need the source are given one.
+        """
+        iterable = _iterable(self)
+        if _weakparents(self):
+            factory = _rerun(iterable, stage, source)
+        else:
+            factory = lambda: stage(iterable, source, {})
+        return (cls or type(self))(IteratorProxy(factory, _cacheable(self)),
+                                   self, operation, stage)
+
+    def replicate(self, iterable):
+        """
+        Creates a copy of this operation chain, with `iterable` as the source.
+        """
+        source, steps = _steps(self)
+        return _replay(type(source)(iterable), steps)
+
+    def detach(self):
+        """
+        Collapse the chain into a single step on top of its source.  The
+        result generates the same values, but holds no reference to the
+        intermediate steps, so their cached results and the undo history are
+        released once nothing else refers to them.
+
+        :returns:
+            A proxy whose parent is the source of the chain.
+        """
+        source, steps = _steps(self)
+        if len(steps) < 2:
+            return self
+        return source._collapse(steps)
+
+    def _collapse(self, steps):
+        """Replay `steps` on this proxy as a single step, see :meth:`detach`."""
+        result = _replay(self, steps)
+        stage = _compose(_stages(result))
+        # The results of the replica's steps are not referred to, so that
+        # they are released along with the replica.
+        return self._chain(stage, ("_collapse", (steps,), None), _source(self),
+                           type(result))
+
+    @classmethod
+    def placeholder(cls, name="source"):
+        """
+        Create a proxy over a placeholder for a source, on which a chain can be
+        built before any data is available.  Evaluating the chain raises
+        ValueError until it is applied to a real source with :meth:`bind`,
+        :meth:`replicate` or :meth:`plan`.
+
+        :parameter name:
+            The name of the source, used in error messages.
+        """
+        return cls(_Placeholder(name))
+
+    def bind(self, source, **params):
+        """
+        Apply the chain to `source` without replicating its steps.  The
+        result is a single step on top of a new proxy over `source`, like the
+        result of :meth:`detach`, and `source` is neither copied nor evaluated.
+        The values of the chain's :class:`Param` parameters are given by
+        keyword.
+
+        :returns:
+            A proxy which generates the results of the chain for `source`.
+        """
+        root, steps = _steps(self)
+        parent = type(root)(source)
+        iterable = _iterable(parent)
+        stage = _compose(_stages(self))
+        factory = lambda: stage(iterable, iterable, params)
+        return type(self)(IteratorProxy(factory), parent,
+                          ("_collapse", (steps,), None), stage)
+
+    def checkpoint(self, storage=None, latest=None):
+        """
+        Mark a point in the chain whose results are materialized the first
+        time they are evaluated.  Every step built on the checkpoint, and the
+        checkpoints of replicas of the chain over the same source object,
+        reuse the materialized results instead of evaluating the steps before
+        the checkpoint again.
+
+        :parameter storage:
+            A mutable mapping in which the results are kept, keyed by the id
+            of the source.  Defaults to a new dict, which is shared with the
+            replicas of the chain.  Results are only reused for the same
+            :class:`Param` values.
+
+        :parameter latest:
+            Whether `storage` only keeps the results of the latest source, so
+            that earlier sources are released.  Defaults to True for the
+            default storage, and to False for a given one.
+
+        :returns:
+            A proxy which generates the same results as this one.
+        """
+        if latest is None:
+            latest = storage is None
+        if storage is None:
+            storage = {}
+        recursive = isinstance(self, RecursiveElementwiseProxy)
+        def stage(iterable, source, params):
+            entry = storage.get(id(source))
+            if entry is None or entry[0] is not source or entry[1] != params:
+                # Recursive results contain lazy branches, which can only be
+                # iterated over once.
+                values = materialize(iterable) if recursive else list(iterable)
+                if latest:
+                    storage.clear()
+                entry = storage[id(source)] = (source, dict(params), values)
+            return iter(entry[2])
+        return self._chain(stage, ("checkpoint", (),
+                                   {"storage": storage, "latest": latest}),
+                           _source(self))
+
+    def persist(self, cache):
+        """
+        Like :meth:`checkpoint`, except that the results are kept in the
+        :class:`ResultCache` `cache`, so that later runs over a source with
+        the same content are served from disk.  Results are keyed by the
+        fingerprint of the chain, a stamp of the content of the source (see
+        :func:`_source_stamp`) and the :class:`Param` values.  Sources that
+        can not be stamped, such as iterators, are evaluated as usual.
+
+        All of the operands of the chain must be compared by value, see
+        :class:`ChainKey`, so that its fingerprint is the same in every
+        process.
+        """
+        key = self.key(source=False)
+        if key._references:
+            raise TypeError("persist requires a chain whose operands are all "
+                            "compared by value, see ChainKey")
+        fingerprint = key.fingerprint()
+        recursive = isinstance(self, RecursiveElementwiseProxy)
+        def stage(iterable, source, params):
+            stamp = _source_stamp(source)
+            if stamp is None:
+                return iter(iterable)
+            import hashlib
+            entry = hashlib.sha1(repr((fingerprint, stamp,
+                                       sorted(params.items())))).hexdigest()
+            values = cache.get(entry)
+            if values is None:
+                values = materialize(iterable) if recursive else list(iterable)
+                cache.put(entry, values)
+            return iter(values)
+        return self._chain(stage, ("persist", (cache,), None), _source(self))
+
+    def plan(self):
+        """
+        Compile the chain into a :class:`Plan`, which evaluates the chain over
+        any source without building a replica of it.  Consecutive elementwise
+        operators, attribute lookups, calls and applications are fused into a
+        single generated function, see `kernel_cache`.
+
+        :returns:
+            A plan for the steps from the source of the chain to this proxy.
+
+        :rtype:
+            :class:`Plan`
+        """
+        source, steps = _steps(self)
+        return Plan(_fused_stages(self),
+                    isinstance(self, RecursiveElementwiseProxy),
+                    (type(source), steps))
+
+    def key(self, source=True):
+        """
+        Return a hashable :class:`ChainKey` for the chain, which, unlike the
+        proxy itself, can be used as a dictionary key.
+
+        :parameter source:
+            Whether the identity of the source is part of the key.  Without
+            it, chains applying the same operations to different sources have
+            equal keys.
+        """
+        references = []
+        root, steps = _steps(self)
+        return ChainKey(_steps_token(root, steps, references, source),
+                        references)
+
+    def fingerprint(self, source=True):
+        """
+        Return a hex digest of the chain's :meth:`key`.
+        """
+        return self.key(source).fingerprint()
+
+    def unbind(self, name="source"):
+        """
+        Create a copy of this chain over a placeholder, see :meth:`placeholder`,
+        so that it can be pickled without its source.
+        """
+        return self.replicate(_Placeholder(name))
+
+    def __reduce__(self):
+        """
+        Chains are pickled as the source of the chain, and the operations
+        leading from it to this proxy.  Operands and the callables given to
+        :meth:`apply` are pickled as usual, so functions must be importable by
+        name.  Use :meth:`unbind` to leave the source out.
+        """
+        source, steps = _steps(self)
+        iterable = _iterable(source)
+        if isinstance(iterable, IteratorProxy):
+            raise TypeError("Chains over iterators can not be pickled, "
+                            "see OperationProxy.unbind")
+        return _restore, (type(source), iterable, steps)
+
+    def undo(self, steps=1):
+        """
+        Starting from the current operation, undo the previous `steps`
+        operations in the chain.
+        
         :parameter steps:
             The number of operations to undo.
         
@@ -372,76 +2622,512 @@ class OperationProxy(object):
         """
         current = self
         for step in range(steps):
-            parent = object.__getattribute__(current, "parent")
+            parent = _parent(current)
             if parent:
                 current = parent
             else:
                 break
         return current
 
+    def apply(self, func, *args, **kwargs):
+        """
+        :parameter func:
+            The function to be applied.
+
+        :parameter memo:
+            A keyword only :class:`Memo`, such as an :class:`LRU`, in which the
+            results of `func` are kept by element value, or "unbounded" for a
+            new :class:`Memo`.  Only use it for pure functions.
+
+        :returns:
+            A proxy which generates the results of::
+
+                func(e, *args, **kwargs)
+
+            for each element e.
+        """
+        memo = kwargs.pop("memo", None)
+        if memo == "unbounded":
+            memo = Memo()
+        if memo is not None:
+            if not isinstance(memo, Memo):
+                raise TypeError("memo must be a Memo or 'unbounded', not %r"
+                                % (memo,))
+            map_ = self._map
+            stage = _parameterize(
+                lambda args, kwargs: map_(_memoize(memo, func, args, kwargs)),
+                args, kwargs)
+            operation = ("apply", (func,) + args, dict(kwargs, memo=memo))
+        else:
+            if args or kwargs:
+                map_ = self._map
+                stage = _parameterize(
+                    lambda args, kwargs: map_(lambda e: func(e, *args, **kwargs)),
+                    args, kwargs)
+            else:
+                stage = self._map(func)
+            operation = ("apply", (func,) + args, kwargs)
+        return self._chain(stage, operation)
+
+    def apply_batch(self, func, size=1024):
+        """
+        Apply a function to lists of elements rather than to each element, so
+        that vectorized functions (numpy, bulk database or model calls) are
+        called once per batch.
+
+        :parameter func:
+            The function to be applied.  It is given a list of up to `size`
+            consecutive elements, and must return a sequence with one result
+            per element, in the same order.
+
+        :parameter size:
+            The number of elements per batch.
+
+        :type size:
+            int
+
+        :returns:
+            A proxy which generates the results of func for each element, in
+            order.  At most one batch is held in memory at a time.
+        """
+        if size < 1:
+            raise ValueError("size must be positive, not %r" % (size,))
+        stage = lambda iterable, source, params: itertools.chain.from_iterable(
+            _batches(func, size, iterable))
+        return self._chain(stage, ("apply_batch", (func,), {"size": size}))
+
+    def __call__(self, *args, **kwargs):
+        """
+        :returns:
+            A proxy which generates the results of::
+
+                e(*args, **kwargs)
+
+            for each element e.
+
+        Calling the result of an attribute access, as in ``words.upper()``,
+        is a single method call step on the proxy the attribute was taken
+        from, so no bound methods are created; undoing it undoes both.
+        """
+        operation = _operation(self)
+        if operation is not None and operation[0] == "__getattr__":
+            try:
+                return _parent(self)._call_method(
+                    operation[1][0], args, tuple(sorted(kwargs.items())))
+            except ReferenceError:
+                # Only the attribute step is left, see __weakparents__.
+                pass
+        map_ = self._map
+        stage = lambda args, kwargs: map_(lambda e: e(*args, **kwargs))
+        return self._chain(_parameterize(stage, args, kwargs),
+                           ("__call__", args, kwargs))
+
+    def _call_method(self, name, args, items):
+        """
+        Return a proxy which generates the results of calling the method
+        `name` of each element with `args`, and the keyword arguments `items`,
+        see :meth:`__call__`.  The keyword arguments are given as a sorted
+        tuple of (name, value) pairs, so that the step is keyed by value.
+        """
+        map_ = self._map
+        stage = lambda args, kwargs: map_(
+            operator.methodcaller(name, *args, **kwargs))
+        return self._chain(_parameterize(stage, args, dict(items)),
+                           ("_call_method", (name, args, items), None))
+
+    @property
+    def item(self):
+        """
+        Index each element, rather than the source as ``proxy[...]`` does.
+
+        >>> rows = ElementwiseProxy([{"price": 2, "qty": 3}, {"price": 5, "qty": 1}])
+        >>> list(rows.item["price"])
+        [2, 5]
+        >>> list(rows.item["price", "qty"])
+        [(2, 3), (5, 1)]
+
+        A tuple of keys projects each element into a tuple of its items.
+        """
+        return _ItemIndexer(self)
+
+    def _item(self, key):
+        """
+        Return a proxy which generates e[key] for each element e, or a tuple
+        of the items if `key` is a tuple, see :attr:`item`.
+        """
+        map_ = self._map
+        if isinstance(self, RecursiveElementwiseProxy):
+            stage = lambda key: map_(_itemgetter(key))
+        else:
+            def stage(key):
+                # Record sources decode only the fields which are read.
+                step = map_(_itemgetter(key))
+                return lambda iterable, source, params: step(
+                    _project(iterable, key), source, params)
+        return self._chain(_parameterize(stage, key), ("_item", (key,), None))
+
+    def where(self, predicate):
+        """
+        Keep only the elements for which `predicate` is true.
+
+        :parameter predicate:
+            A chain built from this one's source, such as
+            ``rows.item["price"] > 3``, which is evaluated alongside this
+            chain; a function of the elements of this chain; or any other
+            iterable of booleans, used as a mask.
+
+        :returns:
+            A proxy which generates the elements of this chain that are kept.
+
+        When `predicate` branches off this chain at an earlier step, the
+        filter is applied at that step instead, so the steps after it never
+        see the rejected elements::
+
+            rows.apply(expensive).where(rows.item["price"] > 3)
+
+        only calls expensive on the rows with a price above 3.  Every later
+        step must generate one result per element, so a ValueError is raised
+        if one of them is recursive, or is a step, such as a filter by a
+        function or by a mask, which may change the number of elements.  If
+        one of them is a pairwise, :meth:`checkpoint` or :meth:`persist` step,
+        which must see every element, the later steps are evaluated for every
+        element and their results are filtered instead.  Filters by chains
+        from the same step commute, so they are combined rather than
+        rejected: in ``n.where(n > 1).where(n < 4)``, both masks are applied
+        to the elements of ``n``.
+
+        ``proxy[mask]`` is the same as ``proxy.where(mask)`` for chains and
+        lists.
+
+        Recursive chains and predicates are not supported, since their
+        elements are branches rather than single values.
+        """
+        if isinstance(self, RecursiveElementwiseProxy) or isinstance(
+                predicate, RecursiveElementwiseProxy):
+            raise TypeError("where does not support recursive proxies, use "
+                            ".each to filter the top level elements")
+        if isinstance(predicate, OperationProxy):
+            shared = _shared_step(self, predicate)
+            if shared is not None:
+                step, depth, steps = shared
+                # The mask must line up with the elements of the shared step.
+                _pushdown(steps)
+                # The predicate is kept relative to the shared step, so that
+                # replicas of the chain test their own elements.
+                predicate = _replay(type(step)(_Placeholder("predicate")),
+                                    steps)
+                return self._where(depth, predicate)
+        elif callable(predicate):
+            stage = lambda iterable, source, params: itertools.ifilter(
+                predicate, iterable)
+            return self._chain(stage, ("where", (predicate,), None))
+        stage = lambda iterable, source, params: itertools.compress(
+            iterable, predicate)
+        return self._chain(stage, ("where", (predicate,), None))
+
+    def _where(self, depth, predicate):
+        """
+        Filter this chain by the chain `predicate`, or by every chain in the
+        tuple `predicate`, which are built on a placeholder for the step
+        `depth` steps before this one, see :meth:`where`.
+        """
+        step, steps = self, []
+        for i in range(depth):
+            operation = _operation(step)
+            if operation is not None and operation[0] == "_where" and \
+                    operation[1][0] == depth - i - 1:
+                # An earlier filter on the same step.  Filters commute, so
+                # the masks are combined there, and the steps after it are
+                # replayed on the combined filter.
+                later = steps[::-1]
+                if _pushdown(later):
+                    earlier = operation[1][1]
+                    if not isinstance(earlier, tuple):
+                        earlier = (earlier,)
+                    combined = _parent(step)._where(operation[1][0],
+                                                    earlier + (predicate,))
+                    return _replay(combined, later)
+            steps.append((type(step), operation))
+            step = _parent(step)
+        prefix = _compose(_stages(step))
+        suffix = _compose(_stages(self)[len(_stages(step)):])
+        predicates = predicate if isinstance(predicate, tuple) else \
+            (predicate,)
+        masks = [_compose(_stages(p)) for p in predicates]
+        if len(masks) == 1:
+            mask = masks[0]
+        else:
+            def mask(iterable, source, params):
+                tested = itertools.tee(iterable, len(masks))
+                return itertools.imap(
+                    lambda *flags: all(flags),
+                    *[m(t, source, params) for m, t in zip(masks, tested)])
+        fields = None
+        if _parent(step) is None:
+            # The predicates and the later steps read the source directly, so
+            # a record source is projected once on the fields they read.
+            fields = _union_fields(_read_fields(steps[::-1]), *[
+                _read_fields(_steps(p)[1]) for p in predicates])
+        def records(source, params):
+            if fields is not None:
+                source = _project(source, fields)
+            return itertools.tee(prefix(source, source, params))
+        if _pushdown(steps):
+            # Filter before the later steps, which are then only evaluated
+            # for the elements that are kept.
+            def stage(iterable, source, params):
+                kept, tested = records(source, params)
+                return suffix(itertools.compress(
+                    kept, mask(tested, source, params)), source, params)
+        else:
+            def stage(iterable, source, params):
+                kept, tested = records(source, params)
+                return itertools.compress(suffix(kept, source, params),
+                                          mask(tested, source, params))
+        return self._chain(stage, ("_where", (depth, predicate), None),
+                           _source(self))
+
+    def _select(self, condition, a, b):
+        """
+        Generate a or b for each element of this chain, depending on the chain
+        `condition`.  Chains over placeholders are built on this one, see
+        :func:`where`.
+        """
+        test = _compose(_stages(condition))
+        read = [_steps(condition)[1]]
+        branches = []
+        for value in (a, b):
+            if not isinstance(value, OperationProxy):
+                branches.append(("constant", value, None))
+            elif isinstance(_source(value), _Placeholder):
+                branches.append(("chain", _compose(_stages(value)),
+                                 _pushdown(_steps(value)[1])))
+                read.append(_steps(value)[1])
+            else:
+                branches.append(("aligned", value, None))
+        kinds = [kind for kind, value, pushdown in branches]
+        if kinds == ["constant", "constant"]:
+            values = {True: a, False: b}.__getitem__
+            stage = lambda iterable, source, params: itertools.imap(
+                values, itertools.imap(operator.truth,
+                                       test(iterable, source, params)))
+            return self._chain(stage, ("_select", (condition, a, b), None),
+                               _source(self))
+        fields = None
+        if _parent(self) is None:
+            # The condition and the branches read the source directly, so a
+            # record source is projected once on the fields they read.
+            fields = _union_fields(*map(_read_fields, read))
+        def stage(iterable, source, params):
+            if fields is not None:
+                iterable = _project(iterable, fields)
+            full = [pushdown is False for kind, value, pushdown in branches]
+            copies = list(itertools.tee(iterable, 2 + full.count(True)))
+            tests = itertools.imap(operator.truth,
+                                   test(copies.pop(), source, params))
+            elements = copies.pop()
+            # Each element is routed to the queue of the branch it is selected
+            # for as it arrives, so nothing is kept for the other branch.
+            queues = {}
+            order = collections.deque()
+            def pump():
+                selected = next(tests)
+                element = next(elements)
+                order.append(selected)
+                if selected in queues:
+                    queues[selected].append(element)
+            def feed(queue):
+                while True:
+                    while not queue:
+                        pump()
+                    yield queue.popleft()
+            lockstep, chosen = {}, {}
+            for (kind, value, pushdown), selected in zip(branches,
+                                                         (True, False)):
+                if kind == "constant":
+                    chosen[selected] = itertools.repeat(value)
+                elif kind == "aligned":
+                    lockstep[selected] = iter(value)
+                elif pushdown:
+                    # The branch is only evaluated for the elements it is
+                    # selected for.
+                    queue = queues[selected] = collections.deque()
+                    chosen[selected] = iter(value(feed(queue), source, params))
+                else:
+                    lockstep[selected] = iter(value(copies.pop(), source,
+                                                    params))
+            # Branches over other sources, and branches which must see every
+            # element, are advanced for every element.
+            while True:
+                if not order:
+                    try:
+                        pump()
+                    except StopIteration:
+                        return
+                selected = order.popleft()
+                result = None
+                for key, values in lockstep.iteritems():
+                    value = next(values)
+                    if key == selected:
+                        result = value
+                if selected in chosen:
+                    result = next(chosen[selected])
+                yield result
+        return self._chain(stage, ("_select", (condition, a, b), None),
+                           _source(self))
+
     def __getattr__(self, item):
-        iterable = IteratorProxy(_iterable(self), _cacheable(self))
-        return type(self)((e.__getattribute__(item) for e in iterable), self)
+        if item in _slots or item in _protocol_names:
+            # Unset slots, and the special names looked up by protocols such
+            # as copy and pickle, must not be broadcast.
+            raise AttributeError(item)
+        return self._chain(self._map(operator.attrgetter(item)),
+                           ("__getattr__", (item,), None))
 
     def __iter__(self):
-        return iter(_iterable(self))
+        iterable = _iterable(self)
+        if isinstance(iterable, IteratorProxy):
+            return iterable.evaluate(terminal=True)
+        return iter(iterable)
 
     def __nonzero__(self):
         return bool(_iterable(self))
 
+    def head(self, n=5):
+        """
+        Evaluate and return the first `n` results of the chain, as a list.
+        The results are kept, and the next iteration over the chain (or over a
+        chain built on top of it) starts with them instead of evaluating them
+        again, so previewing neither costs a full pass nor consumes one-shot
+        sources.
+        """
+        iterable = _iterable(self)
+        if isinstance(iterable, IteratorProxy):
+            return iterable.head(n, terminal=True)
+        if isinstance(iterable, OperationProxy):
+            return iterable.head(n)
+        return list(itertools.islice(iterable, n))
+
+    def _represent(self, f):
+        """
+        Represent the first results using `f`, as previewed by :meth:`head`.
+        """
+        source = _source(self)
+        if isinstance(source, _Placeholder):
+            return [repr(source)]
+        edgeitems = printoptions["edgeitems"]
+        if edgeitems is None:
+            return [f(e) for e in self]
+        items = self.head(edgeitems + 1)
+        representation = [f(e) for e in items[:edgeitems]]
+        if len(items) > edgeitems:
+            representation.append("...")
+        return representation
+
     def __str__(self):
-        return ", ".join(str(e) for e in _iterable(self))
+        return ", ".join(self._represent(str))
 
     def __repr__(self):
-        return "%s([%s])" % (type(self).__name__ , ", ".join(repr(e) for e in _iterable(self)))
+        return "%s([%s])" % (type(self).__name__ , ", ".join(self._represent(repr)))
 
     def __unicode__(self):
-        return u", ".join(unicode(e) for e in _iterable(self))
+        return u", ".join(self._represent(unicode))
 
-    @chainable
     def __reversed__(self):
-        return lambda: reversed(_iterable(self))
+        return self._chain(lambda iterable, source, params: reversed(list(iterable)),
+                           ("__reversed__", (), None))
 
-    @chainable
     def __getitem__(self, item):
-        # Get the original iterable.
+        """
+        Slice the source of the chain, and replicate the chain over the slice.
+        An integer selects a single element slice.  A chain or a list is used
+        as a mask, see :meth:`where`.
+        """
+        if isinstance(item, (OperationProxy, list)):
+            return self.where(item)
         current = self
-        while current.parent:
-            current = current.parent
-        # Now try to replicate this iterable with the parent
-        return self.replicate(current[item])
-
-    @chainable
-    @cacheable
-    def __hash__(self):
-        return lambda: (hash(e) for e in _iterable(self))
-
-    @chainable
-    @cacheable
-    def __invert__(self):
-        return lambda: (~e for e in _iterable(self))
+        while _parent(current) is not None:
+            current = _parent(current)
+        if not isinstance(item, slice):
+            item = slice(item, item + 1 if item != -1 else None)
+        return self.replicate(IteratorProxy(_iterable(current))[item])
+
+
+# Slot accessors, which read proxy state without ever reaching __getattr__.
+_slots = frozenset(OperationProxy.__slots__)
+# The special names that protocols look up on instances, rather than on their
+# types, and which proxies therefore must not answer by broadcasting.  Other
+# special names, such as __name__, are broadcast like any other attribute.
+_protocol_names = frozenset([
+    # copy and pickle
+    "__copy__", "__deepcopy__", "__getstate__", "__setstate__",
+    "__getnewargs__", "__getnewargs_ex__", "__getinitargs__", "__reduce__",
+    "__reduce_ex__",
+    # dir and vars
+    "__dict__", "__members__", "__methods__",
+    # numpy
+    "__array__", "__array_interface__", "__array_struct__",
+    "__array_priority__",
+])
+_iterable = OperationProxy.iterable.__get__
+_operation = OperationProxy.operation.__get__
+_stage = OperationProxy._stage.__get__
+_cacheable_policy = OperationProxy._cacheable_policy.__get__
+_weakparents_policy = OperationProxy._weakparents_policy.__get__
 
-    @chainable
-    @cacheable
-    def __index__(self):
-        return lambda: (operator.index(e) for e in _iterable(self))
-
-    @chainable
-    @cacheable
-    def __neg__(self):
-        return lambda: (-e for e in _iterable(self))
-
-    @chainable
-    @cacheable
-    def __pos__(self):
-        return lambda: (+e for e in _iterable(self))
-
-    @chainable
-    @cacheable
-    def __abs__(self):
-        return lambda: (e.__abs__() for e in _iterable(self))
+def _cacheable(proxy):
+    """
+    Return the caching policy of `proxy`, falling back to the `__cacheable__`
+    attribute of its class (or of its instance dictionary, for subclasses
+    without slots) when none was set on the proxy itself.
+    """
+    policy = _cacheable_policy(proxy)
+    if policy is None:
+        return object.__getattribute__(proxy, "__cacheable__")
+    return policy
 
+def _weakparents(proxy):
+    """Like :func:`_cacheable`, for the `__weakparents__` policy."""
+    policy = _weakparents_policy(proxy)
+    if policy is None:
+        return object.__getattribute__(proxy, "__weakparents__")
+    return policy
 
+def _rerun(iterable, stage, source):
+    """
+    Return the factory of the results of `stage` over `iterable`, the results
+    of a proxy with weak parents, see :meth:`OperationProxy._chain`.  Rather
+    than holding on to `iterable`, and so to the cache of a proxy which may
+    have been released, the factory evaluates every step from the source of
+    the chain again.
+    """
+    while isinstance(iterable, OperationProxy):
+        # Mutators wrap their parent.
+        iterable = _iterable(iterable)
+    base, steps = iterable, ()
+    if isinstance(iterable, IteratorProxy) and \
+            hasattr(iterable.iterable, "steps"):
+        base, steps = iterable.iterable.steps
+    steps += ((stage, source),)
+    def factory():
+        results = base
+        for stage, source in steps:
+            results = stage(results, source, {})
+        return results
+    factory.steps = base, steps
+    return factory
+
+def _parent(proxy, _get=OperationProxy.parent.__get__):
+    parent = _get(proxy)
+    if type(parent) is weakref.ref:
+        parent = parent()
+        if parent is None:
+            raise ReferenceError("The parent of this %s has been released"
+                                 % type(proxy).__name__)
+    return parent
+
+
+@operator_methods
 class ElementwiseProxy(OperationProxy, PairwiseProxyMixin,
                        RecursiveElementwiseProxyMixin):
     """
@@ -488,2768 +3174,627 @@ class ElementwiseProxy(OperationProxy, PairwiseProxyMixin,
     'INDIANS_LITTLE_ONEINDIANS_LITTLE_ONE', 'INDIANS_LITTLE_TWOINDIANS_LITTLE_TWO', 'INDIANS_LITTLE_THREEINDIANS_LITTLE_THREE', 'INDIANS_LITTLE_FOURINDIANS_LITTLE_FOUR'
     """
 
-    @chainable
-    @cacheable
-    def apply(self, func, *args, **kwargs):
-        """
-        :parameter func:
-            The function to be applied.
-            
-        :returns:
-            A function which returns::
-            
-                (func(e, *args, **kwargs) for e in self)
-        
-        :rtype:
-            FunctionType -> GeneratorType
-        """
-        return lambda: (func(e, *args, **kwargs) for e in _iterable(self))
-
-    @chainable
-    @cacheable
-    def __call__(self, *args, **kwargs):
-        """            
-        :returns:
-            A function which returns::
-            
-                (e(*args, **kwargs) for e in self)
-        
-        :rtype:
-            FunctionType -> GeneratorType
-        """
-        return lambda: (e(*args, **kwargs) for e in _iterable(self))
-
-    @chainable
-    @cacheable
-    def __add__(self, other):
-        """            
-        :returns:
-            A function which returns::
-            
-                (e + other for e in self)
-        
-        :rtype:
-            FunctionType -> GeneratorType
-        """
-        return lambda: (e + other for e in _iterable(self))
+    __slots__ = ()
 
-    @chainable
-    @cacheable
-    def __sub__(self, other):
-        """            
-        :returns:
-            A function which returns::
-            
-                (e - other for e in self).
-        
-        :rtype:
-            FunctionType -> GeneratorType
-        """
-        return lambda: (e - other for e in _iterable(self))
+    _expression = "(%s for e in self)"
 
-    @chainable
-    @cacheable
-    def __mul__(self, other):
-        """            
-        :returns:
-            A function which returns::
-                
-                (e * other for e in self).
-        
-        :rtype:
-            FunctionType -> GeneratorType
-        """
-        return lambda: (e * other for e in _iterable(self))
+    @staticmethod
+    def _map(function, operands=(), reflected=False):
+        # starmap over izip reuses the argument tuple, which makes it faster
+        # than imap over several iterables.
+        if not operands:
+            return lambda iterable, source, params: itertools.imap(function, iterable)
+        if reflected:
+            other = operands[0]
+            return lambda iterable, source, params: itertools.starmap(
+                function, itertools.izip(itertools.repeat(other), iterable))
+        return lambda iterable, source, params: itertools.starmap(function,
+            itertools.izip(iterable, *map(itertools.repeat, operands)))
 
-    @chainable
-    @cacheable
-    def __floordiv__(self, other):
-        """            
-        :returns:
-            A function which returns::
-            
-                (e // other for e in self).
-        
-        :rtype:
-            FunctionType -> GeneratorType
-        """
-        return lambda: (e // other for e in _iterable(self))
 
-    @chainable
-    @cacheable
-    def __mod__(self, other):
-        """            
-        :returns:
-            A function which returns::
-                
-                (e % other for e in self).
+@operator_methods
+class RecursiveElementwiseProxy(OperationProxy, PairwiseProxyMixin,
+                                ElementwiseProxyMixin):
+    """
+    Provides recursive elementwise operator behavior, attribute access and
+    method calls over a parent iterable.
+    
+    .. testsetup::
+    
+        treenums = RecursiveElementwiseProxy([[1, 2, 3], [4, 5, 6], [7, 8, 9]])
+       
+    First, create an RecursiveElementwiseProxy from any iterable, like so::
+    
+        treenums = RecursiveElementwiseProxy([[1, 2, 3], [4, 5, 6], [7, 8, 9]])
         
-        :rtype:
-            FunctionType -> GeneratorType
-        """
-        return lambda: (e % other for e in _iterable(self))
-
-    @chainable
-    @cacheable
-    def __divmod__(self, other):
-        """            
-        :returns:
-            A function which returns::
-            
-                (divmod(e, other) for e in self).
+    Yyou can perform a large vareity of operations on the proxy, and it will
+    create a chain of operations to be applied to the contents of the iterable
+    being proxied.  The proxy is fully lazy, so none of the operations will be
+    applied until you begin to request values from the proxy by iterating over
+    it.
+    
+    For example:
         
-        :rtype:
-            FunctionType -> GeneratorType
-        """
-        return lambda: (divmod(e, other) for e in _iterable(self))
+    >>> treenums + 1
+    ((2, 3, 4), (5, 6, 7), (8, 9, 10))
+    >>> treenums * 2
+    ((2, 4, 6), (8, 10, 12), (14, 16, 18))
+    >>> (treenums * 2 + 1).apply(float)
+    ((3.0, 5.0, 7.0), (9.0, 11.0, 13.0), (15.0, 17.0, 19.0))
 
-    @chainable
-    @cacheable
-    def __pow__(self, other, modulo=None):
-        """            
-        :returns:
-            A function which returns::
-            
-                (pow(e, other, modulo) for e in self).
-        
-        :rtype:
-            FunctionType -> GeneratorType
-        """
-        return lambda: (pow(e, other, modulo) for e in _iterable(self))
+    """
 
-    @chainable
-    @cacheable
-    def __lshift__(self, other):
-        """            
-        :returns:
-            A function which returns::
-            
-                (e << other for e in self).
-        
-        :rtype:
-            FunctionType -> GeneratorType
-        """
-        return lambda: (e << other for e in _iterable(self))
+    def __str__(self):
+        return _encoded(self.summary(str))
 
-    @chainable
-    @cacheable
-    def __rshift__(self, other):
-        """            
-        :returns:
-            A function which returns::
-            
-                (e >> other for e in self).
-        
-        :rtype:
-            FunctionType -> GeneratorType
-        """
-        return lambda: (e >> other for e in _iterable(self))
+    def __repr__(self):
+        return _encoded(self.summary(repr))
 
-    @chainable
-    @cacheable
-    def __div__(self, other):
-        """            
-        :returns:
-            A function which returns::
-            
-                (e / other for e in self).
-        
-        :rtype:
-            FunctionType -> GeneratorType
-        """
-        return lambda: (e / other for e in _iterable(self))
+    def __unicode__(self):
+        return self.summary(unicode)
 
-    @chainable
-    @cacheable
-    def __truediv__(self, other):
-        """            
-        :returns:
-            A function which returns::
-            
-                (e / other for e in self), using truediv.
-        
-        :rtype:
-            FunctionType -> GeneratorType
+    def summary(self, f=repr, **options):
         """
-        return lambda: (e.__truediv__(other) for e in _iterable(self))
+        Return a summarized representation of the chain's results, in which
+        only the elements that are shown are evaluated.
 
-    @chainable
-    @cacheable
-    def __radd__(self, other):
-        """            
-        :returns:
-            A function which returns::
-            
-                (other + e for e in self).
-        
-        :rtype:
-            FunctionType -> GeneratorType
-        """
-        return lambda: (other + e for e in _iterable(self))
+        :parameter f:
+            The function used to represent the leaves (repr, str or unicode).
 
-    @chainable
-    @cacheable
-    def __rand__(self, other):
-        """            
-        :returns:
-            A function which returns::
-            
-                (other & e for e in self).
-        
-        :rtype:
-            FunctionType -> GeneratorType
-        """
-        return lambda: (other & e for e in _iterable(self))
+        :parameter options:
+            Overrides for the defaults set with :func:`set_printoptions`
+            (edgeitems, depth and width).
 
-    @chainable
-    @cacheable
-    def __rdiv__(self, other):
-        """            
-        :returns:
-            A function which returns::
-            
-                (other / e for e in self).
-        
-        :rtype:
-            FunctionType -> GeneratorType
-        """
-        return lambda: (other / e for e in _iterable(self))
+        For example:
 
-    @chainable
-    @cacheable
-    def __rdivmod__(self, other):
-        """            
-        :returns:
-            A function which returns::
-            
-                (divmod(other, e) for e in self).
-        
-        :rtype:
-            FunctionType -> GeneratorType
+        >>> RecursiveElementwiseProxy([range(100), [[[[1]]]]]).summary(edgeitems=3, depth=3)
+        '((0, 1, 2, ...), (((...))))'
         """
-        return lambda: (divmod(other, e) for e in _iterable(self))
+        source = _source(self)
+        if isinstance(source, _Placeholder):
+            return repr(source)
+        options = _printoptions(options)
+        if isinstance(source, JSONSource):
+            # The branches of a JSONSource share one reader, so reading ahead
+            # would skip over the children of the previewed branches.  The
+            # document is parsed again instead, depth first.
+            return summarize(iter(self), f, **options)
+        edgeitems = options["edgeitems"]
+        # The shown elements are previewed, so that a one-shot source isn't
+        # consumed by its representation.
+        items = self.head(sys.maxint if edgeitems is None else edgeitems + 1)
+        return summarize(items, f, **options)
 
-    @chainable
-    @cacheable
-    def __rfloordiv__(self, other):
-        """            
-        :returns:
-            A function which returns::
-            
-                (other // e for e in self).
-        
-        :rtype:
-            FunctionType -> GeneratorType
+    def head(self, n=5):
         """
-        return lambda: (other // e for e in _iterable(self))
+        Like :meth:`OperationProxy.head`.  The branches of the results are
+        generated lazily, so the previewed branches also keep the items
+        generated from them, for the next iteration over the chain.
 
-    @chainable
-    @cacheable
-    def __rlshift__(self, other):
-        """            
-        :returns:
-            A function which returns::
-            
-                (other << e for e in self).
-        
-        :rtype:
-            FunctionType -> GeneratorType
+        Chains over a :class:`JSONSource` can't be previewed, since their
+        branches are parsed from a single stream in order.
         """
-        return lambda: (other << e for e in _iterable(self))
+        if isinstance(_source(self), JSONSource):
+            raise TypeError("Can't preview a chain over a JSONSource, its "
+                            "branches are parsed in order")
+        iterable = _iterable(self)
+        if isinstance(iterable, IteratorProxy):
+            return iterable.head(n, terminal=True, wrap=_retain)
+        return super(RecursiveElementwiseProxy, self).head(n)
 
-    @chainable
-    @cacheable
-    def __rmod__(self, other):
-        """            
-        :returns:
-            A function which returns::
-            
-                (e % other for e in self)
-                
-        :rtype:
-            FunctionType -> GeneratorType
+    def render(self, fp, f=str, chunksize=65536):
         """
-        return lambda: (other % e for e in _iterable(self))
-
-    @chainable
-    @cacheable
-    def __rmul__(self, other):
-        """            
-        :returns:
-            A function which returns::
-            
-                (other * e for e in self).
-        
-        :rtype:
-            FunctionType -> GeneratorType
+        Write the full representation of the chain's results to the file
+        object `fp` as it is generated, in chunks of roughly `chunksize`
+        characters.
         """
-        return lambda: (other * e for e in _iterable(self))
+        write_strlike(fp, self, f, chunksize)
 
-    @chainable
-    @cacheable
-    def __ror__(self, other):
-        """            
-        :returns:
-            A function which returns::
-            
-                (other | e for e in self).
-        
-        :rtype:
-            FunctionType -> GeneratorType
+    def inplace(self, copy=True):
         """
-        return lambda: (other | e for e in _iterable(self))
+        Evaluate the chain, writing each leaf result back into the slot (list
+        index or dict key) of the source structure it was computed from, rather
+        than building a new nested structure.
 
-    @chainable
-    @cacheable
-    def __rpow__(self, other):
-        """            
-        :returns:
-            A function which returns::
-            
-                (pow(other, e) for e in self)
-        
-        :rtype:
-            FunctionType -> GeneratorType
-        """
-        return lambda: (pow(other, e) for e in _iterable(self))
+        :parameter copy:
+            If True, immutable branches (tuples, etc) are replaced with an
+            updated copy in their parent's slot.  If False, a TypeError is
+            raised when an immutable branch is encountered.
 
-    @chainable
-    @cacheable
-    def __rrshift__(self, other):
-        """            
-        :returns:
-            A function which returns::
-            
-                (other >> e for e in self)
-        
-        :rtype:
-            FunctionType -> GeneratorType
-        """
-        return lambda: (other >> e for e in _iterable(self))
+        :type copy:
+            bool
 
-    @chainable
-    @cacheable
-    def __rsub__(self, other):
-        """            
         :returns:
-            A function which returns::
-            
-                (other - e for e in self)
-        
-        :rtype:
-            FunctionType -> GeneratorType
+            The source structure, or an updated copy of it if the source itself
+            is immutable.
+
+        .. warning::
+
+            Every step of the chain must be a recursive operation, since other
+            proxies don't preserve the shape of the source.
         """
-        return lambda: (other - e for e in _iterable(self))
+        return writeback(_recursive_source(self, "inplace"), self, copy)
 
-    @chainable
-    @cacheable
-    def __rtruediv__(self, other):
-        """            
-        :returns:
-            A function which returns::
-            
-                (other / e for e in self)
-                
-            using truediv.
-        
-        :rtype:
-            FunctionType -> GeneratorType
+    def dump(self, fp):
         """
-        return lambda: (e.__rtruediv__(other) for e in _iterable(self))
+        Write the results of a chain over a :class:`JSONSource` to the file
+        object `fp` as JSON, as they are generated.  The structure and keys of
+        the source document are preserved.  The document is parsed again,
+        in lockstep with the results, so previewed, cached, checkpointed and
+        persisted results are not reused.
 
-    @chainable
-    @cacheable
+        .. warning::
 
-    def __rxor__(self, other):
-        """            
-        :returns:
-            A function which returns::
-            
-                (other ^ e for e in self)
-        
-        :rtype:
-            FunctionType -> GeneratorType
+            Every step of the chain must be a recursive operation.
         """
-        return lambda: (other ^ e for e in _iterable(self))
+        source = _recursive_source(self, "dump")
+        if not isinstance(source, JSONSource):
+            raise TypeError("dump requires a JSONSource, not %s" %
+                            type(source).__name__)
+        # The source is parsed again by the stages of the chain, rather than
+        # by iterating over the proxy, which may serve previewed or stored
+        # results that don't match the reader's keys.
+        root = iter(source)
+        results = _compose(_lockstep_stages(self))(root, source, {})
+        _dump_json(results, root, fp)
 
-    @chainable
-    @cacheable
-    def __contains__(self, item):
-        """            
-        :returns:
-            A function which returns::
-            
-                (item in e for e in self)
-        
-        :rtype:
-            FunctionType -> GeneratorType
+    def parallel(self, workers=None, executor="thread", grain=64):
         """
-        return lambda: (item in e for e in _iterable(self))
+        Evaluate the chain over subtrees of the source in parallel.
 
-    @chainable
-    @cacheable
-    def __eq__(self, other):
-        """            
-        :returns:
-            A function which returns::
-            
-                (e == other for e in self)
-        
-        :rtype:
-            FunctionType -> GeneratorType
-        """
-        return lambda: (e == other for e in _iterable(self))
+        The source is split into tasks: every branch with at least `grain`
+        nodes below it becomes a task of its own, however few children it has,
+        and smaller siblings are grouped into runs of about `grain` nodes.
+        Tasks are split further as they run, so deep, narrow and badly
+        unbalanced trees still spread out over the workers.  For example:
 
-    @chainable
-    @cacheable
-    def __ne__(self, other):
-        """            
-        :returns:
-            A function which returns::
-            
-                (e != other for e in self)
-        
-        :rtype:
-            FunctionType -> GeneratorType
-        """
-        return lambda: (e != other for e in _iterable(self))
+        >>> def tree(depth):
+        ...     return [tree(depth - 1), tree(depth - 1)] if depth else [depth]
+        >>> deep = RecursiveElementwiseProxy([[tree(10)], [[range(1000)]]]) + 1
+        >>> deep.parallel(workers=4, grain=16) == materialize(deep)
+        True
 
-    @chainable
-    @cacheable
-    def __le__(self, other):
-        """            
-        :returns:
-            A function which returns::
-            
-                (e <= other for e in self)
-        
-        :rtype:
-            FunctionType -> GeneratorType
-        """
-        return lambda: (e <= other for e in _iterable(self))
+        :parameter workers:
+            The number of workers, defaulting to the number of CPUs.
 
-    @chainable
-    @cacheable
-    def __lt__(self, other):
-        """            
-        :returns:
-            A function which returns::
-            
-                (e < other for e in self)
-        
-        :rtype:
-            FunctionType -> GeneratorType
-        """
-        return lambda: (e < other for e in _iterable(self))
+        :type workers:
+            int
 
-    @chainable
-    @cacheable
-    def __gt__(self, other):
-        """            
-        :returns:
-            A function which returns::
-            
-                (e > other for e in self)
-        
-        :rtype:
-            FunctionType -> GeneratorType
-        """
-        return lambda: (e > other for e in _iterable(self))
+        :parameter executor:
+            "thread" runs the tasks on threads, which steal work from each
+            other's task queues.  "process" runs them on a forked process pool
+            that shares a task queue; the chain and source are inherited by the
+            workers, so only slots and results are pickled.
 
-    @chainable
-    @cacheable
-    def __ge__(self, other):
-        """            
-        :returns:
-            A function which returns::
-            
-                (e >= other for e in self)
-        
-        :rtype:
-            FunctionType -> GeneratorType
-        """
-        return lambda: (e >= other for e in _iterable(self))
+        :type executor:
+            str
 
-    @chainable
-    @cacheable
-    def __cmp__(self, other):
-        """            
-        :returns:
-            A function which returns::
-            
-                (cmp(e, other) for e in self)
-        
-        :rtype:
-            FunctionType -> GeneratorType
-        """
-        return lambda: (cmp(e, other) for e in _iterable(self))
+        :parameter grain:
+            The minimum task size, in nodes.
 
-    @chainable
-    @cacheable
-    def __and__(self, other):
-        """            
-        :returns:
-            A function which returns::
-            
-                (e & other for e in self)
-        
-        :rtype:
-            FunctionType -> GeneratorType
-        """
-        return lambda: (e & other for e in _iterable(self))
+        :type grain:
+            int
 
-    @chainable
-    @cacheable
-    def __xor__(self, other):
-        """            
         :returns:
-            A function which returns::
-            
-                (e ^ other for e in self)
-        
-        :rtype:
-            FunctionType -> GeneratorType
-        """
-        return lambda: (e ^ other for e in _iterable(self))
+            The results, as nested tuples in the order of the source.
 
-    @chainable
-    @cacheable
-    def __or__(self, other):
-        """            
-        :returns:
-            A function which returns::
-            
-                (e | other for e in self)
-        
         :rtype:
-            FunctionType -> GeneratorType
-        """
-        return lambda: (e | other for e in _iterable(self))
+            tuple
 
-    @chainable
-    @cacheable
-    def __iand__(self, other):
-        """            
-        :returns:
-            A function which returns::
-            
-                (e &= other for e in self)
-                
-        :rtype:
-            FunctionType -> GeneratorType
-            
         .. warning::
-        
-            For mutable types, this operations can not be undone once finalized.
-        """
-        return lambda: (e.__iand__(other) for e in _iterable(self))
 
-    @chainable
-    @cacheable
-    def __ixor__(self, other):
-        """            
-        :returns:
-            A function which returns::
-            
-                (e =^ other for e in self)
-            
-        :rtype:
-            FunctionType -> GeneratorType
-            
-        .. warning::
-            
-            For mutable types, this operations can not be undone once finalized.
-        """
-        return lambda: (e.__ixor__(other) for e in _iterable(self))
+            Every step of the chain must be a recursive operation.  The
+            source is walked once before the tasks are split, to find the
+            branches it repeats, which are only evaluated at their first
+            occurrence, as in a serial evaluation.
+        """
+        source = _recursive_source(self, "parallel")
+        if not isinstance(source, (collections.Sequence, collections.Mapping)):
+            return materialize(self)
+        if not workers:
+            import multiprocessing
+            workers = multiprocessing.cpu_count()
+        root = _Subtree()
+        survey = _survey(source)
+        if executor == "thread":
+            _steal_work(self, source, grain, survey, (root, (), None), workers)
+        elif executor == "process":
+            _share_work(self, source, grain, survey, (root, (), None),
+                        workers)
+        else:
+            raise ValueError("Unknown executor %r" % executor)
+        return _assemble(root.values)
 
-    @chainable
-    @cacheable
-    def __ior__(self, other):
-        """            
-        :returns:
-            A function which returns::
-            
-                (e |= other for e in self)
-                
-        :rtype:
-            FunctionType -> GeneratorType
-            
-        .. warning::
-            
-            For mutable types, this operations can not be undone once finalized.
+    def apply_batch(self, func, size=1024):
         """
-        return lambda: (e.__ior__(other) for e in _iterable(self))
-
-    @chainable
-    @cacheable
-    def __iadd__(self, other):
-        """            
-        :returns:
-            A function which returns::
-            
-                (e |= other for e in self)
-                
-        :rtype:
-            FunctionType -> GeneratorType
-            
-        .. warning::
-            
-            For mutable types, this operations can not be undone once finalized.
+        Batches are not defined over nested structures; use ``.each`` to batch
+        the top level elements instead.
         """
-        return lambda: (e.__iadd__(other) for e in _iterable(self))
+        raise TypeError("apply_batch is not supported by recursive proxies, "
+                        "use .each.apply_batch")
 
-    @chainable
-    @cacheable
-    def __isub__(self, other):
-        """            
-        :returns:
-            A function which returns::
-            
-                (e -= other for e in self)
-                
-        :rtype:
-            FunctionType -> GeneratorType
-            
-        .. warning::
-            
-            For mutable types, this operations can not be undone once finalized.
-        """
-        return lambda: (e.__isub__(other) for e in _iterable(self))
+    __slots__ = ()
 
-    @chainable
-    @cacheable
-    def __imul__(self, other):
-        """            
-        :returns:
-            A function which returns::
-            
-                (e *= other for e in self)
-                
-        :rtype:
-            FunctionType -> GeneratorType
-            
-        .. warning::
-            
-            For mutable types, this operations can not be undone once finalized.
-        """
-        return lambda: (e.__imul__(other) for e in _iterable(self))
+    _expression = "graphmap(lambda e: %s, self)"
 
-    @chainable
-    @cacheable
-    def __idiv__(self, other):
-        """            
-        :returns:
-            A function which returns::
-            
-                (e /= other for e in self)
-                
-        :rtype:
-            FunctionType -> GeneratorType
-            
-        .. warning::
-            
-            For mutable types, this operations can not be undone once finalized.
+    @staticmethod
+    def _map(function, operands=(), reflected=False):
         """
-        return lambda: (e.__idiv__(other) for e in _iterable(self))
-
-    @chainable
-    @cacheable
-    def __itruediv__(self, other):
-        """            
-        :returns:
-            A function which returns::
-            
-                (e |= other for e in self)
-                
-            using truediv.
-                
-        :rtype:
-            FunctionType -> GeneratorType
-            
-        .. warning::
-            
-            For mutable types, this operations can not be undone once finalized.
+        Depth first graph traversal and function application.
         """
-        return lambda: (e.__itruediv__(other) for e in _iterable(self))
+        if reflected:
+            leaf = functools.partial(function, *operands)
+        elif operands:
+            leaf = lambda e: function(e, *operands)
+        else:
+            leaf = function
+        return lambda iterable, source, params: graphmap(leaf, iterable)
 
-    @chainable
-    @cacheable
-    def __ifloordiv__(self, other):
-        """            
-        :returns:
-            A function which returns::
-            
-                (e //= other for e in self)
-                
-        :rtype:
-            FunctionType -> GeneratorType
-            
-        .. warning::
-            
-            For mutable types, this operations can not be undone once finalized.
-        """
-        return lambda: (e.__ifloordiv__(other) for e in _iterable(self))
 
-    @chainable
-    @cacheable
-    def __imod__(self, other):
-        """            
-        :returns:
-            A function which returns::
-            
-                (e %= other for e in self)
-                
-        :rtype:
-            FunctionType -> GeneratorType
-            
-        .. warning::
-            
-            For mutable types, this operations can not be undone once finalized.
-        """
-        return lambda: (e.__imod__(other) for e in _iterable(self))
-
-    @chainable
-    @cacheable
-    def __ipow__(self, other, modulo=None):
-        """            
-        :returns:
-            A function which returns::
-            
-                (e **= other for e in self)
-                
-        :rtype:
-            FunctionType -> GeneratorType
-            
-        .. warning::
-            
-            For mutable types, this operations can not be undone once finalized.
-        """
-        return lambda: (e.__ipow__(other, modulo) for e in _iterable(self))
-
-    @chainable
-    @cacheable
-    def __ilshift__(self, other):
-        """            
-        :returns:
-            A function which returns::
-            
-                (e <<= other for e in self)
-                
-        :rtype:
-            FunctionType -> GeneratorType
-            
-        .. warning::
-            
-            For mutable types, this operations can not be undone once finalized.
-        """
-        return lambda: (e.__ilshift__(other) for e in _iterable(self))
-
-    @chainable
-    @cacheable
-    def __irshift__(self, other):
-        """            
-        :returns:
-            A function which returns::
-            
-                (e >>= other for e in self)
-                        
-        :rtype:
-            FunctionType -> GeneratorType
-            
-        .. warning::
-            
-            For mutable types, this operations can not be undone once finalized.
-        """
-        return lambda: (e.__irshift__(other) for e in _iterable(self))
-
-
-class RecursiveElementwiseProxy(OperationProxy, PairwiseProxyMixin,
-                                ElementwiseProxyMixin):
+@operator_methods
+class PairwiseProxy(OperationProxy, ElementwiseProxyMixin,
+                    RecursiveElementwiseProxyMixin):
     """
-    Provides recursive elementwise operator behavior, attribute access and
-    method calls over a parent iterable.
+    Provides pairwise operator behavior, attribute access and method calls
+    over a parent iterable.
     
     .. testsetup::
     
-        treenums = RecursiveElementwiseProxy([[1, 2, 3], [4, 5, 6], [7, 8, 9]])
+       nums = PairwiseProxy([1, 2, 3, 4])
        
-    First, create an RecursiveElementwiseProxy from any iterable, like so::
+    First, create an PairProxy from any iterable, like so::
     
-        treenums = RecursiveElementwiseProxy([[1, 2, 3], [4, 5, 6], [7, 8, 9]])
+        nums = PairwiseProxy([1, 2, 3, 4])
         
-    Yyou can perform a large vareity of operations on the proxy, and it will
+    You can perform a large vareity of operations on the proxy, and it will
     create a chain of operations to be applied to the contents of the iterable
-    being proxied.  The proxy is fully lazy, so none of the operations will be
+    being proxied.  The proxy is completely lazy, so none of the operations will be
     applied until you begin to request values from the proxy by iterating over
     it.
     
     For example:
-        
-    >>> treenums + 1
-    ((2, 3, 4), (5, 6, 7), (8, 9, 10))
-    >>> treenums * 2
-    ((2, 4, 6), (8, 10, 12), (14, 16, 18))
-    >>> (treenums * 2 + 1).apply(float)
-    ((3.0, 5.0, 7.0), (9.0, 11.0, 13.0), (15.0, 17.0, 19.0))
-
+    
+    >>> nums + [1, 2, 3, 4]
+    2, 4, 6, 8
+    >>> nums * [2, 2, 3, 3]
+    2, 4, 9, 12
+    >>> nums == [2, 2, 3, 5]
+    False, True, True, False
+    >>> (nums.apply(float) / itertools.count(2) + itertools.count(1)).apply(round, args=itertools.repeat([2]))
+    1.5, 2.67, 3.75, 4.8
+    >>> abs(nums - [3, 2, 1, 1])
+    2, 0, 2, 3
+    >>> (nums * [2, 2, 1, 5] + [3, 5, 9, 0]) / [4, 1, 2, 3]
+    1, 9, 6, 6
+    >>> ((nums * itertools.repeat(2) + itertools.repeat(3)) / itertools.repeat(4)).replicate([2, 2, 3, 3])
+    1, 0, 0, 0
+    >>> ((nums * [2, 3, 4, 5]) > [5, 6, 7, 8]) != [True, True, False, True]
+    True, True, True, False
     """
 
-    def __str__(self):
-        return as_strlike(self)
-
-    def __repr__(self):
-        return as_strlike(self, repr)
+    __slots__ = ()
 
-    def __unicode__(self):
-        return as_strlike(self, unicode)
+    _expression = "imap(lambda e, other: %s, self, other)"
 
+    @staticmethod
+    def _map(function, operands=(), reflected=False):
+        if not operands:
+            return lambda iterable, source, params: itertools.imap(function, iterable)
+        other, constants = operands[0], operands[1:]
+        if reflected:
+            return lambda iterable, source, params: itertools.starmap(
+                function, itertools.izip(other, iterable))
+        return lambda iterable, source, params: itertools.starmap(function,
+            itertools.izip(iterable, other, *map(itertools.repeat, constants)))
 
-    @chainable
-    @cacheable
-    def apply(self, f, *args, **kwargs):
-        """
-        Depth first graph traversal and function application.
+    def apply(self, func, args=None, kwargs=None):
         """
-        return lambda: graphmap(lambda e: f(e, *args, **kwargs), self.iterable)
-
-    @chainable
-    @cacheable
-    def __call__(self, *args, **kwargs):
-        """            
-        :returns:
-            A function which returns::
-            
-                graphmap(lambda e: e(*args, **kwargs), self)
+        :parameter func:
+            The function to be applied.
         
-        :rtype:
-            FunctionType -> GeneratorType
-        """
-        return lambda: graphmap(lambda e: e(*args, **kwargs), self.iterable)
-
-    @chainable
-    @cacheable
-    def __add__(self, other):
-        """            
-        :returns:
-            A function which returns::
-            
-                graphmap(lambda e: e + other, self)
+        :parameter args:
+            The positional arguments for each element of the PairwiseProxy
         
-        :rtype:
-            FunctionType -> GeneratorType
-        """
-        return lambda: graphmap(lambda e: e + other, self.iterable)
-
-    @chainable
-    @cacheable
-    def __sub__(self, other):
-        """            
-        :returns:
-            A function which returns::
-            
-                graphmap(lambda e: e - other, self)
+        :type args:
+            Sequence
         
-        :rtype:
-            FunctionType -> GeneratorType
-        """
-        return lambda: graphmap(lambda e: e - other, self.iterable)
-
-    @chainable
-    @cacheable
-    def __mul__(self, other):
-        """            
-        :returns:
-            A function which returns::
-            
-                graphmap(lambda e: e * other, self)
+        :parameter kwargs:
+            The keyword arguments for each element of the PairwiseProxy
         
-        :rtype:
-            FunctionType -> GeneratorType
-        """
-        return lambda: graphmap(lambda e: e * other, self.iterable)
-
-    @chainable
-    @cacheable
-    def __floordiv__(self, other):
-        """            
-        :returns:
-            A function which returns::
-            
-                graphmap(lambda e: e // other, self)
+        :type kwargs:
+            Sequence
         
-        :rtype:
-            FunctionType -> GeneratorType
-        """
-        return lambda: graphmap(lambda e: e // other, self.iterable)
-
-    @chainable
-    @cacheable
-    def __mod__(self, other):
-        """            
         :returns:
-            A function which returns::
+            A proxy which generates::
             
-                graphmap(lambda e: e % other, self)
-        
-        :rtype:
-            FunctionType -> GeneratorType
+                imap(func, self, args, kwargs)
         """
-        return lambda: graphmap(lambda e: e % other, self.iterable)
+        operation = ("apply", (func, args, kwargs), None)
+        def stage(args, kwargs):
+            if not args:
+                args = itertools.repeat(tuple())
+            if not kwargs:
+                kwargs = itertools.repeat({})
+            return lambda iterable, source, params: itertools.imap(lambda x, y, z: func(x, *y, **z), iterable, args, kwargs)
+        return self._chain(_parameterize(stage, args, kwargs), operation)
 
-    @chainable
-    @cacheable
-    def __divmod__(self, other):
-        """            
-        :returns:
-            A function which returns::
-            
-                graphmap(lambda e: divmod(e, other), self)
-        
-        :rtype:
-            FunctionType -> GeneratorType
+    def __call__(self, args=None, kwargs=None):
         """
-        return lambda: graphmap(lambda e: divmod(e, other), self.iterable)
-
-    @chainable
-    @cacheable
-    def __pow__(self, other, modulo=None):
-        """            
-        :returns:
-            A function which returns::
-            
-                graphmap(lambda e: pow(e, other, modulo), self)
+        :parameter args:
+            The positional arguments for each element of the PairwiseProxy
         
-        :rtype:
-            FunctionType -> GeneratorType
-        """
-        return lambda: graphmap(lambda e: pow(e, other, modulo), self.iterable)
-
-    @chainable
-    @cacheable
-    def __lshift__(self, other):
-        """            
-        :returns:
-            A function which returns::
-            
-                graphmap(lambda e: e << other, self)
+        :type args:
+            Sequence
         
-        :rtype:
-            FunctionType -> GeneratorType
-        """
-        return lambda: graphmap(lambda e: e << other, self.iterable)
-
-    @chainable
-    @cacheable
-    def __rshift__(self, other):
-        """            
-        :returns:
-            A function which returns::
-            
-                graphmap(lambda e: e >> other, self)
-            
-            
+        :parameter kwargs:
+            The keyword arguments for each element of the PairwiseProxy
         
-        :rtype:
-            FunctionType -> GeneratorType
-        """
-        return lambda: graphmap(lambda e: e >> other, self.iterable)
-
-    @chainable
-    @cacheable
-    def __div__(self, other):
-        """            
-        :returns:
-            A function which returns::
-            
-                graphmap(lambda e: e / other, self)
+        :type kwargs:
+            Sequence
         
-        :rtype:
-            FunctionType -> GeneratorType
-        """
-        return lambda: graphmap(lambda e: e / other, self.iterable)
-
-    @chainable
-    @cacheable
-    def __truediv__(self, other):
-        """            
         :returns:
-            A function which returns::
+            A proxy which generates::
             
-                graphmap(lambda e: e / other, self)
-                
-            using truediv.
-        
-        :rtype:
-            FunctionType -> GeneratorType
+                imap(self, self, args, kwargs)
         """
-        return lambda: graphmap(lambda e: e.__truediv__(other), self.iterable)
+        operation = ("__call__", (args, kwargs), None)
+        def stage(args, kwargs):
+            if not args:
+                args = itertools.repeat(tuple())
+            if not kwargs:
+                kwargs = itertools.repeat({})
+            return lambda iterable, source, params: itertools.imap(lambda x, y, z: x(*y, **z), iterable, args, kwargs)
+        return self._chain(_parameterize(stage, args, kwargs), operation)
 
-    @chainable
-    @cacheable
-    def __radd__(self, other):
-        """            
-        :returns:
-            A function which returns::
-            
-                graphmap(lambda e: other + e, self)
-        
-        :rtype:
-            FunctionType -> GeneratorType
-        """
-        return lambda: graphmap(lambda e: other + e, self.iterable)
 
-    @chainable
-    @cacheable
-    def __rand__(self, other):
-        """            
-        :returns:
-            A function which returns::
-            
-                graphmap(lambda e: other & e, self)
-        
-        :rtype:
-            FunctionType -> GeneratorType
-        """
-        return lambda: graphmap(lambda e: other & e, self.iterable)
+class ColumnProxy(PairwiseProxy):
+    """
+    A :class:`PairwiseProxy` over a column of a :class:`RecordProxy`, whose
+    operators also accept scalar operands, which are repeated for every
+    element.  Operands which are not iterable, and strings, are scalars.
 
-    @chainable
-    @cacheable
-    def __rdiv__(self, other):
-        """            
-        :returns:
-            A function which returns::
-            
-                graphmap(lambda e: other / e, self)
-        
-        :rtype:
-            FunctionType -> GeneratorType
-        """
-        return lambda: graphmap(lambda e: other / e, self.iterable)
+    >>> list(ColumnProxy([2.0, 5.0]) * 2 + [1, 0])
+    [5.0, 10.0]
+    """
 
-    @chainable
-    @cacheable
-    def __rdivmod__(self, other):
-        """            
-        :returns:
-            A function which returns::
-            
-                graphmap(lambda e: divmod(other, e), self)
-        
-        :rtype:
-            FunctionType -> GeneratorType
-        """
-        return lambda: graphmap(lambda e: divmod(other, e), self.iterable)
+    __slots__ = ()
 
-    @chainable
-    @cacheable
-    def __rfloordiv__(self, other):
-        """            
-        :returns:
-            A function which returns::
-            
-                graphmap(lambda e: other // e, self)
-        
-        :rtype:
-            FunctionType -> GeneratorType
-        """
-        return lambda: graphmap(lambda e: other // e, self.iterable)
+    @staticmethod
+    def _map(function, operands=(), reflected=False):
+        if operands and (isinstance(operands[0], basestring) or
+                         not isinstance(operands[0], collections.Iterable)):
+            operands = (itertools.repeat(operands[0]),) + operands[1:]
+        return PairwiseProxy._map(function, operands, reflected)
 
-    @chainable
-    @cacheable
-    def __rlshift__(self, other):
-        """            
-        :returns:
-            A function which returns::
-            
-                graphmap(lambda e: other << e, self)
-        
-        :rtype:
-            FunctionType -> GeneratorType
-        """
-        return lambda: graphmap(lambda e: other << e, self.iterable)
 
-    @chainable
-    @cacheable
-    def __rmod__(self, other):
-        """            
-        :returns:
-            A function which returns::
-            
-                graphmap(lambda e: e % other for e in self)
-                
-        :rtype:
-            FunctionType -> GeneratorType
-        """
-        return lambda: graphmap(lambda e: other % e, self.iterable)
+# The array typecodes of the column types that arrays can hold, see _column.
+_TYPECODES = {int: "l", float: "d"}
 
-    @chainable
-    @cacheable
-    def __rmul__(self, other):
-        """            
-        :returns:
-            A function which returns::
-            
-                graphmap(lambda e: other * e, self)
-        
-        :rtype:
-            FunctionType -> GeneratorType
-        """
-        return lambda: graphmap(lambda e: other * e, self.iterable)
+def _column(values):
+    """
+    Store a column of values in an array if they all have a type which arrays
+    can hold, or in a list otherwise.
+    """
+    if values:
+        kind = type(values[0])
+        typecode = _TYPECODES.get(kind)
+        if typecode is not None and set(map(type, values)) == set([kind]):
+            return array.array(typecode, values)
+    return list(values)
 
-    @chainable
-    @cacheable
-    def __ror__(self, other):
-        """            
-        :returns:
-            A function which returns::
-            
-                graphmap(lambda e: other | e, self)
-        
-        :rtype:
-            FunctionType -> GeneratorType
-        """
-        return lambda: graphmap(lambda e: e | other, self.iterable)
 
-    @chainable
-    @cacheable
-    def __rpow__(self, other):
-        """            
-        :returns:
-            A function which returns::
-            
-                graphmap(lambda e: pow(other, e), self)
-        
-        :rtype:
-            FunctionType -> GeneratorType
-        """
-        return lambda: graphmap(lambda e: pow(other, e), self.iterable)
+class RecordProxy(object):
+    """
+    A columnar view of a list of records: dicts, tuples (including named
+    tuples), or other objects.  The records are transposed once into a column
+    per field, and the columns are returned as :class:`ColumnProxy` objects
+    by attribute or item access, so that arithmetic between columns neither
+    walks the records again nor looks up the fields of each record.  Columns
+    can be combined with scalars as well as with other columns.
 
-    @chainable
-    @cacheable
-    def __rrshift__(self, other):
-        """            
-        :returns:
-            A function which returns::
-            
-                graphmap(lambda e: other >> e, self)
-        
-        :rtype:
-            FunctionType -> GeneratorType
-        """
-        return lambda: graphmap(lambda e: other >> e, self.iterable)
+    .. testsetup::
 
-    @chainable
-    @cacheable
-    def __rsub__(self, other):
-        """            
-        :returns:
-            A function which returns::
-            
-                graphmap(lambda e: other - e, self)
-        
-        :rtype:
-            FunctionType -> GeneratorType
-        """
-        return lambda: graphmap(lambda e: other - e, self.iterable)
+        rows = RecordProxy([{"price": 2.0, "qty": 3}, {"price": 5.0, "qty": 1}])
 
-    @chainable
-    @cacheable
-    def __rtruediv__(self, other):
-        """            
-        :returns:
-            A function which returns::
-            
-                graphmap(lambda e: other / e, self)
-                
-            using truediv.
-        
-        :rtype:
-            FunctionType -> GeneratorType
+    For example:
+
+    >>> list(rows.price * rows.qty)
+    [6.0, 5.0]
+    >>> list(rows.price * 1.5 + 1)
+    [4.0, 8.5]
+    >>> [sorted(r.items()) for r in rows.with_columns(total=rows.price * rows.qty).records()]
+    [[('price', 2.0), ('qty', 3), ('total', 6.0)], [('price', 5.0), ('qty', 1), ('total', 5.0)]]
+
+    Columns of ints or floats are kept in arrays, and other columns in lists.
+    Fields whose names clash with the methods of this class are available by
+    item access only.
+    """
+
+    __slots__ = ("fields", "_columns", "_record_type")
+
+    def __init__(self, records=(), fields=None):
         """
-        return lambda: graphmap(lambda e: e.__rtruediv__(other), self.iterable)
+        :parameter records:
+            The records.  Every record must have every field.
 
-    @chainable
-    @cacheable
+        :parameter fields:
+            The fields to keep, which are the keys of dicts, the indexes (or
+            names, for named tuples) of tuples, or the attribute names of
+            other objects.  Defaults to every field of the first record, in
+            sorted order for dicts and objects.
 
-    def __rxor__(self, other):
-        """            
-        :returns:
-            A function which returns::
-            
-                graphmap(lambda e: other ^ e, self)
-        
-        :rtype:
-            FunctionType -> GeneratorType
+        :type fields:
+            Sequence
         """
-        return lambda: graphmap(lambda e: e ^ other, self.iterable)
+        if fields is not None:
+            records = _project(records, tuple(fields))
+        records = list(records)
+        first = records[0] if records else {}
+        record_type, getter = dict, operator.itemgetter
+        if isinstance(first, collections.Mapping):
+            if fields is None:
+                fields = sorted(first)
+            keys = fields
+        elif isinstance(first, tuple):
+            names = list(getattr(first, "_fields", range(len(first))))
+            if fields is None:
+                fields = names
+            keys = [f if isinstance(f, int) else names.index(f)
+                    for f in fields]
+            if list(fields) == names:
+                # Only records with all of their fields can be rebuilt.
+                record_type = type(first) if hasattr(first, "_fields") else tuple
+        else:
+            if fields is None:
+                fields = sorted(vars(first))
+            keys, getter = fields, operator.attrgetter
+        fields = tuple(fields)
+        if len(fields) == 1:
+            columns = [map(getter(*keys), records)]
+        elif fields:
+            columns = zip(*map(getter(*keys), records)) or [()] * len(fields)
+        else:
+            columns = []
+        self._set(fields, [_column(c) for c in columns], record_type)
+
+    def _set(self, fields, columns, record_type):
+        object.__setattr__(self, "fields", fields)
+        object.__setattr__(self, "_columns", tuple(columns))
+        object.__setattr__(self, "_record_type", record_type)
+
+    def __getattr__(self, name):
+        if name in RecordProxy.__slots__ or name in _protocol_names:
+            raise AttributeError(name)
+        try:
+            return self[name]
+        except KeyError:
+            raise AttributeError(name)
 
-    @chainable
-    @cacheable
-    def __contains__(self, item):
-        """            
-        :returns:
-            A function which returns::
-            
-                graphmap(lambda e: item in e, self)
-        
-        :rtype:
-            FunctionType -> GeneratorType
+    def __getitem__(self, key):
         """
-        return lambda: graphmap(lambda e: item in e, self.iterable)
+        Return the column of the field `key`, or a :class:`RecordProxy` of the
+        fields in `key` if it is a tuple.
+        """
+        if isinstance(key, tuple):
+            proxy = object.__new__(RecordProxy)
+            proxy._set(key, map(self.column_values, key), dict)
+            return proxy
+        return ColumnProxy(self.column_values(key))
+
+    def column_values(self, field):
+        """Return the array or list of the values of `field`."""
+        try:
+            return self._columns[self.fields.index(field)]
+        except ValueError:
+            raise KeyError(field)
+
+    def with_columns(self, **columns):
+        """
+        Return a :class:`RecordProxy` with the columns given by keyword, as
+        proxies or other iterables, added or replaced.  The new columns are
+        evaluated immediately, and must have one value per record.
+        """
+        fields, values = list(self.fields), list(self._columns)
+        for field, column in sorted(columns.items()):
+            column = _column(list(column))
+            if fields and len(column) != len(self):
+                raise ValueError("Column %r has %d values for %d records"
+                                 % (field, len(column), len(self)))
+            if field in fields:
+                values[fields.index(field)] = column
+            else:
+                fields.append(field)
+                values.append(column)
+        record_type = self._record_type
+        if record_type is not dict and len(fields) != len(self.fields):
+            record_type = dict
+        proxy = object.__new__(RecordProxy)
+        proxy._set(tuple(fields), values, record_type)
+        return proxy
+
+    def records(self):
+        """
+        Generate the records, as tuples or named tuples if the records were
+        tuples with all of their fields, and as dicts otherwise.
+        """
+        rows = itertools.izip(*self._columns)
+        if self._record_type is dict:
+            fields = self.fields
+            return (dict(itertools.izip(fields, row)) for row in rows)
+        if self._record_type is tuple:
+            return rows
+        return itertools.starmap(self._record_type, rows)
 
-    @chainable
-    @cacheable
-    def __eq__(self, other):
-        """            
-        :returns:
-            A function which returns::
-            
-                graphmap(lambda e: e == other, self)
-        
-        :rtype:
-            FunctionType -> GeneratorType
-        """
-        return lambda: graphmap(lambda e: e == other, self.iterable)
-
-    @chainable
-    @cacheable
-    def __ne__(self, other):
-        """            
-        :returns:
-            A function which returns::
-            
-                graphmap(lambda e: e != other, self)
-        
-        :rtype:
-            FunctionType -> GeneratorType
-        """
-        return lambda: graphmap(lambda e: e != other, self.iterable)
-
-    @chainable
-    @cacheable
-    def __le__(self, other):
-        """            
-        :returns:
-            A function which returns::
-            
-                graphmap(lambda e: e <= other, self)
-        
-        :rtype:
-            FunctionType -> GeneratorType
-        """
-        return lambda: graphmap(lambda e: e <= other, self.iterable)
-
-    @chainable
-    @cacheable
-    def __lt__(self, other):
-        """            
-        :returns:
-            A function which returns::
-            
-                graphmap(lambda e: e < other, self)
-        
-        :rtype:
-            FunctionType -> GeneratorType
-        """
-        return lambda: graphmap(lambda e: e < other, self.iterable)
-
-    @chainable
-    @cacheable
-    def __gt__(self, other):
-        """            
-        :returns:
-            A function which returns::
-            
-                graphmap(lambda e: e > other, self)
-        
-        :rtype:
-            FunctionType -> GeneratorType
-        """
-        return lambda: graphmap(lambda e: e > other, self.iterable)
-
-    @chainable
-    @cacheable
-    def __ge__(self, other):
-        """            
-        :returns:
-            A function which returns::
-            
-                graphmap(lambda e: e >= other, self)
-        
-        :rtype:
-            FunctionType -> GeneratorType
-        """
-        return lambda: graphmap(lambda e: e >= other, self.iterable)
-
-    @chainable
-    @cacheable
-    def __cmp__(self, other):
-        """            
-        :returns:
-            A function which returns::
-            
-                graphmap(lambda e: cmp(e, other), self)
-        
-        :rtype:
-            FunctionType -> GeneratorType
-        """
-        return lambda: graphmap(lambda e: cmp(e, other), self.iterable)
-
-    @chainable
-    @cacheable
-    def __and__(self, other):
-        """            
-        :returns:
-            A function which returns::
-            
-                graphmap(lambda e: e & other, self)
-        
-        :rtype:
-            FunctionType -> GeneratorType
-        """
-        return lambda: graphmap(lambda e: e & other, self.iterable)
-
-    @chainable
-    @cacheable
-    def __xor__(self, other):
-        """            
-        :returns:
-            A function which returns::
-            
-                graphmap(lambda e: e ^ other, self)
-        
-        :rtype:
-            FunctionType -> GeneratorType
-        """
-        return lambda: graphmap(lambda e: e ^ other, self.iterable)
-
-    @chainable
-    @cacheable
-    def __or__(self, other):
-        """            
-        :returns:
-            A function which returns::
-            
-                graphmap(lambda e: e | other, self)
-        
-        :rtype:
-            FunctionType -> GeneratorType
-        """
-        return lambda: graphmap(lambda e: e | other, self.iterable)
-
-    @chainable
-    @cacheable
-    def __iand__(self, other):
-        """            
-        :returns:
-            A function which returns::
-            
-                graphmap(lambda e: e &= other, self)
-                
-        :rtype:
-            FunctionType -> GeneratorType
-            
-        .. warning::
-            
-            For mutable types, this operations can not be undone once finalized.
-        """
-        return lambda: graphmap(lambda e: e.__iand__(other), self.iterable)
-
-    @chainable
-    @cacheable
-    def __ixor__(self, other):
-        """            
-        :returns:
-            A function which returns::
-            
-                graphmap(lambda e: e =^ other, self)
-            
-        :rtype:
-            FunctionType -> GeneratorType
-            
-        .. warning::
-            
-            For mutable types, this operations can not be undone once finalized.
-        """
-        return lambda: graphmap(lambda e: e.__ixor__(other), self.iterable)
-
-    @chainable
-    @cacheable
-    def __ior__(self, other):
-        """            
-        :returns:
-            A function which returns::
-            
-                graphmap(lambda e: e |= other, self)
-                
-        :rtype:
-            FunctionType -> GeneratorType
-            
-        .. warning::
-            
-            For mutable types, this operations can not be undone once finalized.
-        """
-        return lambda: graphmap(lambda e: e.__ior__(other), self.iterable)
-
-    @chainable
-    @cacheable
-    def __iadd__(self, other):
-        """            
-        :returns:
-            A function which returns::
-            
-                graphmap(lambda e: e += other, self)
-                
-        :rtype:
-            FunctionType -> GeneratorType
-            
-        .. warning::
-            
-            For mutable types, this operations can not be undone once finalized.
-        """
-        return lambda: graphmap(lambda e: e.__iadd__(other), self.iterable)
-
-    @chainable
-    @cacheable
-    def __isub__(self, other):
-        """            
-        :returns:
-            A function which returns::
-            
-                graphmap(lambda e: e -= other, self)
-                
-        :rtype:
-            FunctionType -> GeneratorType
-            
-        .. warning::
-            
-            For mutable types, this operations can not be undone once finalized.
-        """
-        return lambda: graphmap(lambda e: e.__isub__(other), self.iterable)
+    def __iter__(self):
+        return self.records()
 
-    @chainable
-    @cacheable
-    def __imul__(self, other):
-        """            
-        :returns:
-            A function which returns::
-            
-                graphmap(lambda e: e *= other, self)
-                
-        :rtype:
-            FunctionType -> GeneratorType
-            
-        .. warning::
-            
-            For mutable types, this operations can not be undone once finalized.
-        """
-        return lambda: graphmap(lambda e: e.__imul__(other), self.iterable)
+    def __len__(self):
+        return len(self._columns[0]) if self._columns else 0
 
-    @chainable
-    @cacheable
-    def __idiv__(self, other):
-        """            
-        :returns:
-            A function which returns::
-            
-                graphmap(lambda e: e /= other, self)
-                
-        :rtype:
-            FunctionType -> GeneratorType
-            
-        .. warning::
-            
-            For mutable types, this operations can not be undone once finalized.
-        """
-        return lambda: graphmap(lambda e: e.__idiv__(other), self.iterable)
+    def __setattr__(self, name, value):
+        raise AttributeError("RecordProxy objects are immutable, see "
+                             "RecordProxy.with_columns")
 
-    @chainable
-    @cacheable
-    def __itruediv__(self, other):
-        """            
-        :returns:
-            A function which returns::
-            
-                graphmap(lambda e: e |= other, self)
-                
-            using truediv.
-                
-        :rtype:
-            FunctionType -> GeneratorType
-            
-        .. warning::
-            
-            For mutable types, this operations can not be undone once finalized.
-        """
-        return lambda: graphmap(lambda e: e.__itruediv__(other), self.iterable)
+    def __repr__(self):
+        return "RecordProxy(<%d records>, fields=%r)" % (len(self),
+                                                          self.fields)
 
-    @chainable
-    @cacheable
-    def __ifloordiv__(self, other):
-        """            
-        :returns:
-            A function which returns::
-            
-                graphmap(lambda e: e //= other, self)
-                
-        :rtype:
-            FunctionType -> GeneratorType
-            
-        .. warning::
-            
-            For mutable types, this operations can not be undone once finalized.
-        """
-        return lambda: graphmap(lambda e: e.__ifloordiv__(other), self.iterable)
 
-    @chainable
-    @cacheable
-    def __imod__(self, other):
-        """            
-        :returns:
-            A function which returns::
-            
-                graphmap(lambda e: e %= other, self)
-                
-        :rtype:
-            FunctionType -> GeneratorType
-            
-        .. warning::
-            
-            For mutable types, this operations can not be undone once finalized.
-        """
-        return lambda: graphmap(lambda e: e.__imod__(other), self.iterable)
+def where(condition, a, b):
+    """
+    Select a or b for each element, depending on `condition`, lazily.
 
-    @chainable
-    @cacheable
-    def __ipow__(self, other, modulo=None):
-        """            
-        :returns:
-            A function which returns::
-            
-                graphmap(lambda e: e **= other, self)
-                
-        :rtype:
-            FunctionType -> GeneratorType
-            
-        .. warning::
-            
-            For mutable types, this operations can not be undone once finalized.
-        """
-        return lambda: graphmap(lambda e: e.__ipow__(other, modulo), self.iterable)
+    :parameter condition:
+        A chain which generates a true or false value for each element.
 
-    @chainable
-    @cacheable
-    def __ilshift__(self, other):
-        """            
-        :returns:
-            A function which returns::
-            
-                graphmap(lambda e:  <<= other, self)
-                
-        :rtype:
-            FunctionType -> GeneratorType
-            
-        .. warning::
-            
-            For mutable types, this operations can not be undone once finalized.
-        """
-        return lambda: graphmap(lambda e: e.__ilshift__(other), self.iterable)
+    :parameter a:
+        The result where the condition is true: a chain, or a constant.
 
-    @chainable
-    @cacheable
-    def __irshift__(self, other):
-        """            
-        :returns:
-            A function which returns::
-            
-                graphmap(lambda e: e >>= other, self)
-                        
-        :rtype:
-            FunctionType -> GeneratorType
-            
-        .. warning::
-            
-            For mutable types, this operations can not be undone once finalized.
-        """
-        return lambda: graphmap(lambda e: e.__irshift__(other), self.iterable)
+    :parameter b:
+        The result where the condition is false: a chain, or a constant.
 
+    :returns:
+        A proxy which generates the selected results, on top of the latest
+        step shared by `condition` and the branches.
 
-class PairwiseProxy(OperationProxy, ElementwiseProxyMixin,
-                    RecursiveElementwiseProxyMixin):
-    """
-    Provides pairwise operator behavior, attribute access and method calls
-    over a parent iterable.
-    
-    .. testsetup::
-    
-       nums = PairwiseProxy([1, 2, 3, 4])
-       
-    First, create an PairProxy from any iterable, like so::
-    
-        nums = PairwiseProxy([1, 2, 3, 4])
-        
-    You can perform a large vareity of operations on the proxy, and it will
-    create a chain of operations to be applied to the contents of the iterable
-    being proxied.  The proxy is completely lazy, so none of the operations will be
-    applied until you begin to request values from the proxy by iterating over
-    it.
-    
     For example:
-    
-    >>> nums + [1, 2, 3, 4]
-    2, 4, 6, 8
-    >>> nums * [2, 2, 3, 3]
-    2, 4, 9, 12
-    >>> nums == [2, 2, 3, 5]
-    False, True, True, False
-    >>> (nums.apply(float) / itertools.count(2) + itertools.count(1)).apply(round, args=itertools.repeat([2]))
-    1.5, 2.67, 3.75, 4.8
-    >>> abs(nums - [3, 2, 1, 1])
-    2, 0, 2, 3
-    >>> (nums * [2, 2, 1, 5] + [3, 5, 9, 0]) / [4, 1, 2, 3]
-    1, 9, 6, 6
-    >>> ((nums * itertools.repeat(2) + itertools.repeat(3)) / itertools.repeat(4)).replicate([2, 2, 3, 3])
-    1, 0, 0, 0
-    >>> ((nums * [2, 3, 4, 5]) > [5, 6, 7, 8]) != [True, True, False, True]
-    True, True, True, False
-    """
 
-    @chainable
-    @cacheable
-    def apply(self, func, args=None, kwargs=None):
-        """
-        :parameter func:
-            The function to be applied.
-        
-        :parameter args:
-            The positional arguments for each element of the PairwiseProxy
-        
-        :type args:
-            Sequence
-        
-        :parameter kwargs:
-            The keyword arguments for each element of the PairwiseProxy
-        
-        :type kwargs:
-            Sequence
-        
-        :returns:
-            A function which returns::
-            
-                imap(func, self, args, kwargs)
-        
-        :rtype:
-            FunctionType -> GeneratorType
-        """
-        iterable = object.__getattribute__(self, "iterable")
-        if not args:
-            args = itertools.repeat(tuple())
-        if not kwargs:
-            kwargs = itertools.repeat({})
-        return lambda: itertools.imap(lambda x, y, z: func(x, *y, **z), iterable, args, kwargs)
+    >>> import math
+    >>> nums = ElementwiseProxy([1, -2, 3])
+    >>> list(where(nums > 0, nums.apply(math.log), 0.0))
+    [0.0, 0.0, 1.0986122886681098]
 
-    @chainable
-    @cacheable
-    def __call__(self, args=None, kwargs=None):
-        """
-        :parameter args:
-            The positional arguments for each element of the PairwiseProxy
-        
-        :type args:
-            Sequence
-        
-        :parameter kwargs:
-            The keyword arguments for each element of the PairwiseProxy
-        
-        :type kwargs:
-            Sequence
-        
-        :returns:
-            A function which returns::
-            
-                imap(self, self, args, kwargs)
-        
-        :rtype:
-            FunctionType -> GeneratorType
-        """
-        iterable = object.__getattribute__(self, "iterable")
-        if not args:
-            args = itertools.repeat(tuple())
-        if not kwargs:
-            kwargs = itertools.repeat({})
-        return lambda: itertools.imap(lambda x, y, z: x(*y, **z), iterable, args, kwargs)
+    Branches built from the same source as `condition` are only evaluated for
+    the elements they are selected for, under the same conditions as the
+    pushdown of :meth:`OperationProxy.where`, so math.log never sees -2.
+    Chains over other sources are lined up with the elements, and advanced
+    for every element.
 
-    @chainable
-    @cacheable
-    def __add__(self, other):
-        """            
-        :returns:
-            A function which returns::
-            
-                imap(lambda x, y: x + y, self, other)
-        
-        :rtype:
-            FunctionType -> GeneratorType
-        """
-        iterable = object.__getattribute__(self, "iterable")
-        return lambda: itertools.imap(lambda x, y: x + y, iterable, other)
-
-    @chainable
-    @cacheable
-    def __sub__(self, other):
-        """ 
-        :parameter other:
-            The other object to use for each element of the PairwiseProxy
-        
-        :type others:
-            Sequence
-                   
-        :returns:
-            A function which returns::
-            
-                imap(lambda x, y: x - y, self, other)
-        
-        :rtype:
-            FunctionType -> GeneratorType
-        """
-        iterable = object.__getattribute__(self, "iterable")
-        return lambda: itertools.imap(lambda x, y: x - y, iterable, other)
-
-    @chainable
-    @cacheable
-    def __mul__(self, other):
-        """
-        :parameter other:
-            The other object to use for each element of the PairwiseProxy
-        
-        :type others:
-            Sequence
-                        
-        :returns:
-            A function which returns::
-            
-                imap(lambda x, y: x * y, self, other)
-        
-        :rtype:
-            FunctionType -> GeneratorType
-        """
-        iterable = object.__getattribute__(self, "iterable")
-        return lambda: itertools.imap(lambda x, y: x * y, iterable, other)
-
-    @chainable
-    @cacheable
-    def __floordiv__(self, other):
-        """            
-        :parameter other:
-            The other object to use for each element of the PairwiseProxy
-        
-        :type others:
-            Sequence
-        
-        :returns:
-        
-            A function which returns::
-            
-                imap(lambda x, y: x // y, self, other)
-        
-        :rtype:
-            FunctionType -> GeneratorType
-        """
-        iterable = object.__getattribute__(self, "iterable")
-        return lambda: itertools.imap(lambda x, y: x // y, iterable, other)
-
-    @chainable
-    @cacheable
-    def __mod__(self, other):
-        """            
-        :parameter other:
-            The other object to use for each element of the PairwiseProxy
-        
-        :type others:
-            Sequence
-        
-        :returns:
-            A function which returns::
-            
-                imap(lambda x, y: x % y, self, other)
-        
-        :rtype:
-            FunctionType -> GeneratorType
-        """
-        iterable = object.__getattribute__(self, "iterable")
-        return lambda: itertools.imap(lambda x, y: x % y, iterable, other)
-
-    @chainable
-    @cacheable
-    def __divmod__(self, other):
-        """            
-        :parameter other:
-            The other object to use for each element of the PairwiseProxy
-        
-        :type others:
-            Sequence
-        
-        :returns:
-            A function which returns::
-            
-                imap(lambda x, y: x % y, self, other)
-        
-        :rtype:
-            FunctionType -> GeneratorType
-        """
-        iterable = object.__getattribute__(self, "iterable")
-        return lambda: itertools.imap(divmod, iterable, other)
-
-    @chainable
-    @cacheable
-    def __pow__(self, other, modulo=None):
-        """            
-        :parameter others:
-            The other object to use for each element of the PairwiseProxy
-        
-        :type others:
-            Sequence
-        
-        :returns:
-            A function which returns::
-            
-                imap(lambda x, y: x + y, self, other)
-        
-        :rtype:
-            FunctionType -> GeneratorType
-        """
-        iterable = object.__getattribute__(self, "iterable")
-        return lambda: itertools.imap(lambda x, y: pow(x, y, modulo), iterable, other)
-
-    @chainable
-    @cacheable
-    def __lshift__(self, other):
-        """            
-        :parameter other:
-            The other object to use for each element of the PairwiseProxy
-        
-        :type others:
-            Sequence
-        
-        :returns:
-            A function which returns::
-            
-                imap(lambda x, y: x << y, self, other)
-        
-        :rtype:
-            FunctionType -> GeneratorType
-        """
-        iterable = object.__getattribute__(self, "iterable")
-        return lambda: itertools.imap(lambda x, y: x << y, iterable, other)
-
-    @chainable
-    @cacheable
-    def __rshift__(self, other):
-        """            
-        :parameter other:
-            The other object to use for each element of the PairwiseProxy
-        
-        :type others:
-            Sequence
-        
-        :returns:
-            A function which returns::
-            
-                imap(lambda x, y: x >> y, self, other)
-        
-        :rtype:
-            FunctionType -> GeneratorType
-        """
-        iterable = object.__getattribute__(self, "iterable")
-        return lambda: itertools.imap(lambda x, y: x >> y, iterable, other)
-
-    @chainable
-    @cacheable
-    def __div__(self, other):
-        """            
-        :parameter other:
-            The other object to use for each element of the PairwiseProxy
-        
-        :type others:
-            Sequence
-        
-        :returns:
-            A function which returns::
-            
-                imap(lambda x, y: x / y, self, other)
-        
-        :rtype:
-            FunctionType -> GeneratorType
-        """
-        iterable = object.__getattribute__(self, "iterable")
-        return lambda: itertools.imap(lambda x, y: x / y, iterable, other)
-
-    @chainable
-    @cacheable
-    def __truediv__(self, other):
-        """            
-        :parameter other:
-            The other object to use for each element of the PairwiseProxy
-        
-        :type others:
-            Sequence
-        
-        :returns:
-            A function which returns::
-            
-                imap(lambda x, y: x / y, self, other)
-        
-        :rtype:
-            FunctionType -> GeneratorType
-        """
-        iterable = object.__getattribute__(self, "iterable")
-        return lambda: itertools.imap(lambda x, y: x.__truediv__(y), iterable, other)
-
-    @chainable
-    @cacheable
-    def __radd__(self, other):
-        """            
-        :parameter other:
-            The other object to use for each element of the PairwiseProxy
-        
-        :type others:
-            Sequence
-        
-        :returns:
-            A function which returns::
-            
-                imap(lambda x, y: y + x, self, other)
-        
-        :rtype:
-            FunctionType -> GeneratorType
-        """
-        iterable = object.__getattribute__(self, "iterable")
-        return lambda: itertools.imap(lambda x, y: y + x, iterable, other)
-
-    @chainable
-    @cacheable
-    def __rand__(self, other):
-        """            
-        :parameter other:
-            The other object to use for each element of the PairwiseProxy
-        
-        :type others:
-            Sequence
-        
-        :returns:
-            A function which returns::
-            
-                imap(lambda x, y: y & x, self, other)
-        
-        :rtype:
-            FunctionType -> GeneratorType
-        """
-        iterable = object.__getattribute__(self, "iterable")
-        return lambda: itertools.imap(lambda x, y: y & x, iterable, other)
-
-    @chainable
-    @cacheable
-    def __rdiv__(self, other):
-        """            
-        :parameter other:
-            The other object to use for each element of the PairwiseProxy
-        
-        :type others:
-            Sequence
-        
-        :returns:
-            A function which returns::
-            
-                imap(lambda x, y: y / x, self, other)
-        
-        :rtype:
-            FunctionType -> GeneratorType
-        """
-        iterable = object.__getattribute__(self, "iterable")
-        return lambda: itertools.imap(lambda x, y: y / x, iterable, other)
-
-    @chainable
-    @cacheable
-    def __rdivmod__(self, other):
-        """            
-        :parameter other:
-            The other object to use for each element of the PairwiseProxy
-        
-        :type others:
-            Sequence
-        
-        :returns:
-            A function which returns::
-            
-                imap(lambda x, y: divmod(y, x), self, other)
-        
-        :rtype:
-            FunctionType -> GeneratorType
-        """
-        iterable = object.__getattribute__(self, "iterable")
-        return lambda: itertools.imap(lambda x, y: divmod(y, x), iterable, other)
-
-    @chainable
-    @cacheable
-    def __rfloordiv__(self, other):
-        """            
-        :parameter other:
-            The other object to use for each element of the PairwiseProxy
-        
-        :type others:
-            Sequence
-        
-        :returns:
-            A function which returns::
-            
-                imap(lambda x, y: y // x, self, other)
-        
-        :rtype:
-            FunctionType -> GeneratorType
-        """
-        iterable = object.__getattribute__(self, "iterable")
-        return lambda: itertools.imap(lambda x, y: y // x, iterable, other)
-
-    @chainable
-    @cacheable
-    def __rlshift__(self, other):
-        """            
-        :parameter other:
-            The other object to use for each element of the PairwiseProxy
-        
-        :type others:
-            Sequence
-        
-        :returns:
-            A function which returns::
-            
-                imap(lambda x, y: y << x, self, other)
-        
-        :rtype:
-            FunctionType -> GeneratorType
-        """
-        iterable = object.__getattribute__(self, "iterable")
-        return lambda: itertools.imap(lambda x, y: y << x, iterable, other)
-
-    @chainable
-    @cacheable
-    def __rmod__(self, other):
-        """            
-        :parameter other:
-            The other object to use for each element of the PairwiseProxy
-        
-        :type others:
-            Sequence
-        
-        :returns:
-            A function which returns::
-            
-                imap(lambda x, y: y % x, self, other)
-        
-        :rtype:
-            FunctionType -> GeneratorType
-        """
-        iterable = object.__getattribute__(self, "iterable")
-        return lambda: itertools.imap(lambda x, y: y % x, iterable, other)
-
-    @chainable
-    @cacheable
-    def __rmul__(self, other):
-        """            
-        :parameter other:
-            The other object to use for each element of the PairwiseProxy
-        
-        :type others:
-            Sequence
-        
-        :returns:
-            A function which returns::
-            
-                imap(lambda x, y: y * x, self, other)
-        
-        :rtype:
-            FunctionType -> GeneratorType
-        """
-        iterable = object.__getattribute__(self, "iterable")
-        return lambda: itertools.imap(lambda x, y: y * x, iterable, other)
-
-    @chainable
-    @cacheable
-    def __ror__(self, other):
-        """            
-        :parameter other:
-            The other object to use for each element of the PairwiseProxy
-        
-        :type others:
-            Sequence
-        
-        :returns:
-            A function which returns::
-            
-                imap(lambda x, y: y | x, self, other)
-        
-        :rtype:
-            FunctionType -> GeneratorType
-        """
-        iterable = object.__getattribute__(self, "iterable")
-        return lambda: itertools.imap(lambda x, y: y | x, iterable, other)
-
-    @chainable
-    @cacheable
-    def __rpow__(self, other):
-        """            
-        :parameter other:
-            The other object to use for each element of the PairwiseProxy
-        
-        :type others:
-            Sequence
-        
-        :returns:
-            A function which returns::
-            
-                imap(lambda x, y: y ** x, self, other)
-        
-        :rtype:
-            FunctionType -> GeneratorType
-        """
-        iterable = object.__getattribute__(self, "iterable")
-        return lambda: itertools.imap(lambda x, y: y ** x, iterable, other)
-
-    @chainable
-    @cacheable
-    def __rrshift__(self, other):
-        """            
-        :parameter other:
-            The other object to use for each element of the PairwiseProxy
-        
-        :type others:
-            Sequence
-        
-        :returns:
-            A function which returns::
-            
-                imap(lambda x, y: y >> x, self, other)
-        
-        :rtype:
-            FunctionType -> GeneratorType
-        """
-        iterable = object.__getattribute__(self, "iterable")
-        return lambda: itertools.imap(lambda x, y: y >> x, iterable, other)
-
-    @chainable
-    @cacheable
-    def __rsub__(self, other):
-        """            
-        :parameter other:
-            The other object to use for each element of the PairwiseProxy
-        
-        :type others:
-            Sequence
-        
-        :returns:
-            A function which returns::
-            
-                imap(lambda x, y: y - x, self, other)
-        
-        :rtype:
-            FunctionType -> GeneratorType
-        """
-        iterable = object.__getattribute__(self, "iterable")
-        return lambda: itertools.imap(lambda x, y: y - x, iterable, other)
-
-    @chainable
-    @cacheable
-    def __rtruediv__(self, other):
-        """            
-        :parameter other:
-            The other object to use for each element of the PairwiseProxy
-        
-        :type others:
-            Sequence
-        
-        :returns:
-            A function which returns::
-            
-                imap(lambda x, y: y / x, self, other)
-                
-            using truediv.
-        
-        :rtype:
-            FunctionType -> GeneratorType
-        """
-        iterable = object.__getattribute__(self, "iterable")
-        return lambda: itertools.imap(lambda x, y: x.__rtruediv__(y), iterable, other)
-
-    @chainable
-    @cacheable
-    def __rxor__(self, other):
-        """            
-        :parameter other:
-            The other object to use for each element of the PairwiseProxy
-        
-        :type others:
-            Sequence
-        
-        :returns:
-            A function which returns::
-            
-                imap(lambda x, y: y ^ x, self, other)
-        
-        :rtype:
-            FunctionType -> GeneratorType
-        """
-        iterable = object.__getattribute__(self, "iterable")
-        return lambda: itertools.imap(lambda x, y: y ^ x, iterable, other)
-
-    @chainable
-    @cacheable
-    def __contains__(self, item):
-        """            
-        :parameter other:
-            The other object to use for each element of the PairwiseProxy
-        
-        :type others:
-            Sequence
-        
-        :returns:
-            A function which returns::
-            
-                imap(lambda x, y: y in x, self, other)
-        
-        :rtype:
-            FunctionType -> GeneratorType
-        """
-        iterable = object.__getattribute__(self, "iterable")
-        return lambda: itertools.imap(lambda x, y: y in x, iterable, item)
-
-    @chainable
-    @cacheable
-    def __eq__(self, other):
-        """            
-        :parameter other:
-            The other object to use for each element of the PairwiseProxy
-        
-        :type others:
-            Sequence
-        
-        :returns:
-            A function which returns::
-            
-                imap(lambda x, y: x == y, self, other)
-        
-        :rtype:
-            FunctionType -> GeneratorType
-        """
-        iterable = object.__getattribute__(self, "iterable")
-        return lambda: itertools.imap(lambda x, y: x == y, iterable, other)
-
-    @chainable
-    @cacheable
-    def __ne__(self, other):
-        """            
-        :parameter other:
-            The other object to use for each element of the PairwiseProxy
-        
-        :type others:
-            Sequence
-        
-        :returns:
-            A function which returns::
-            
-                imap(lambda x, y: x != y, self, other)
-        
-        :rtype:
-            FunctionType -> GeneratorType
-        """
-        iterable = object.__getattribute__(self, "iterable")
-        return lambda: itertools.imap(lambda x, y: x != y, iterable, other)
-
-    @chainable
-    @cacheable
-    def __le__(self, other):
-        """            
-        :parameter other:
-            The other object to use for each element of the PairwiseProxy
-        
-        :type others:
-            Sequence
-        
-        :returns:
-            A function which returns::
-            
-                imap(lambda x, y: x <= y, self, other)
-        
-        :rtype:
-            FunctionType -> GeneratorType
-        """
-        iterable = object.__getattribute__(self, "iterable")
-        return lambda: itertools.imap(lambda x, y: x <= y, iterable, other)
-
-    @chainable
-    @cacheable
-    def __lt__(self, other):
-        """            
-        :parameter other:
-            The other object to use for each element of the PairwiseProxy
-        
-        :type others:
-            Sequence
-        
-        :returns:
-            A function which returns::
-            
-                imap(lambda x, y: x < y, self, other)
-        
-        :rtype:
-            FunctionType -> GeneratorType
-        """
-        iterable = object.__getattribute__(self, "iterable")
-        return lambda: itertools.imap(lambda x, y: x < y, iterable, other)
-
-    @chainable
-    @cacheable
-    def __gt__(self, other):
-        """            
-        :parameter other:
-            The other object to use for each element of the PairwiseProxy
-        
-        :type others:
-            Sequence
-        
-        :returns:
-            A function which returns::
-            
-                imap(lambda x, y: x > y, self, other)
-        
-        :rtype:
-            FunctionType -> GeneratorType
-        """
-        iterable = object.__getattribute__(self, "iterable")
-        return lambda: itertools.imap(lambda x, y: x > y, iterable, other)
-
-    @chainable
-    @cacheable
-    def __ge__(self, other):
-        """            
-        :parameter other:
-            The other object to use for each element of the PairwiseProxy
-        
-        :type others:
-            Sequence
-        
-        :returns:
-            A function which returns::
-            
-                imap(lambda x, y: y / x, self, other)
-        
-        :rtype:
-            FunctionType -> GeneratorType
-        """
-        iterable = object.__getattribute__(self, "iterable")
-        return lambda: itertools.imap(lambda x, y: x >= y, iterable, other)
-
-    @chainable
-    @cacheable
-    def __cmp__(self, other):
-        """            
-        :parameter other:
-            The other object to use for each element of the PairwiseProxy
-        
-        :type others:
-            Sequence
-        
-        :returns:
-            A function which returns::
-            
-                imap(cmp, self, other)
-        
-        :rtype:
-            FunctionType -> GeneratorType
-        """
-        iterable = object.__getattribute__(self, "iterable")
-        return lambda: itertools.imap(lambda x, y: x.__cmp__(y), iterable, other)
-
-    @chainable
-    @cacheable
-    def __and__(self, other):
-        """            
-        :parameter other:
-            The other object to use for each element of the PairwiseProxy
-        
-        :type others:
-            Sequence
-        
-        :returns:
-            A function which returns::
-            
-                imap(lambda x, y: x & y, self, other)
-        
-        :rtype:
-            FunctionType -> GeneratorType
-        """
-        iterable = object.__getattribute__(self, "iterable")
-        return lambda: itertools.imap(lambda x, y: x & y, iterable, other)
-
-    @chainable
-    @cacheable
-    def __xor__(self, other):
-        """            
-        :parameter other:
-            The other object to use for each element of the PairwiseProxy
-        
-        :type others:
-            Sequence
-        
-        :returns:
-            A function which returns::
-            
-                imap(lambda x, y: x ^ y, self, other)
-        
-        :rtype:
-            FunctionType -> GeneratorType
-        """
-        iterable = object.__getattribute__(self, "iterable")
-        return lambda: itertools.imap(lambda x, y: x ^ y, iterable, other)
-
-    @chainable
-    @cacheable
-    def __or__(self, other):
-        """            
-        :parameter other:
-            The other object to use for each element of the PairwiseProxy
-        
-        :type others:
-            Sequence
-        
-        :returns:
-            A function which returns::
-            
-                imap(lambda x, y: x | y, self, other)
-        
-        :rtype:
-            FunctionType -> GeneratorType
-        """
-        iterable = object.__getattribute__(self, "iterable")
-        return lambda: itertools.imap(lambda x, y: x | y, iterable, other)
-
-    @chainable
-    @cacheable
-    def __iand__(self, other):
-        """            
-        :parameter other:
-            The other object to use for each element of the PairwiseProxy
-        
-        :type others:
-            Sequence
-        
-        :returns:
-            A function which returns::
-            
-                imap(lambda x, y: x &= y, self, other)
-                
-        :rtype:
-            FunctionType -> GeneratorType
-        
-        .. warning::
-            
-            For mutable types, this operations can not be undone once finalized.
-        """
-        iterable = object.__getattribute__(self, "iterable")
-        return lambda: itertools.imap(lambda x, y: x.__iand__(y), iterable, other)
-
-    @chainable
-    @cacheable
-    def __ixor__(self, other):
-        """            
-        :returns:
-            A function which returns::
-            
-                imap(lambda x, y: x ^= y, self, other)
-        
-        :rtype:
-            FunctionType -> GeneratorType
-            
-        .. warning::
-            
-            For mutable types, this operations can not be undone once finalized.
-        """
-        iterable = object.__getattribute__(self, "iterable")
-        return lambda: itertools.imap(lambda x, y: x.__ixor__(y), iterable, other)
-
-    @chainable
-    @cacheable
-    def __ior__(self, other):
-        """            
-        :parameter other:
-            The other object to use for each element of the PairwiseProxy
-        
-        :type others:
-            Sequence
-        
-        :returns:
-            A function which returns::
-            
-                imap(lambda x, y: x |= y, self, other)
-        
-        :rtype:
-            FunctionType -> GeneratorType
-            
-        .. warning::
-            
-            For mutable types, this operations can not be undone once finalized.
-        """
-        iterable = object.__getattribute__(self, "iterable")
-        return lambda: itertools.imap(lambda x, y: x.__ior__(y), iterable, other)
-
-    @chainable
-    @cacheable
-    def __iadd__(self, other):
-        """            
-        :parameter other:
-            The other object to use for each element of the PairwiseProxy
-        
-        :type others:
-            Sequence
-        
-        :returns:
-            A function which returns::
-            
-                imap(lambda x, y: x += y, self, other)
-        
-        :rtype:
-            FunctionType -> GeneratorType
-            
-        .. warning::
-            
-            For mutable types, this operations can not be undone once finalized.
-        """
-        iterable = object.__getattribute__(self, "iterable")
-        return lambda: itertools.imap(lambda x, y: x.__iadd__(y), iterable, other)
-
-    @chainable
-    @cacheable
-    def __isub__(self, other):
-        """            
-        :parameter other:
-            The other object to use for each element of the PairwiseProxy
-        
-        :type others:
-            Sequence
-        
-        :returns:
-            A function which returns::
-            
-                imap(lambda x, y: x -= y, self, other)
-        
-        :rtype:
-            FunctionType -> GeneratorType
-            
-        .. warning::
-            
-            For mutable types, this operations can not be undone once finalized.
-        """
-        iterable = object.__getattribute__(self, "iterable")
-        return lambda: itertools.imap(lambda x, y: x.__isub__(y), iterable, other)
-
-    @chainable
-    @cacheable
-    def __imul__(self, other):
-        """            
-        :parameter other:
-            The other object to use for each element of the PairwiseProxy
-        
-        :type others:
-            Sequence
-        
-        :returns:
-            A function which returns::
-            
-                imap(lambda x, y: x *= y, self, other)
-        
-        :rtype:
-            FunctionType -> GeneratorType
-            
-        .. warning::
-            
-            For mutable types, this operations can not be undone once finalized.
-        """
-        iterable = object.__getattribute__(self, "iterable")
-        return lambda: itertools.imap(lambda x, y: x.__imul__(y), iterable, other)
-
-    @chainable
-    @cacheable
-    def __idiv__(self, other):
-        """            
-        :parameter other:
-            The other object to use for each element of the PairwiseProxy
-        
-        :type others:
-            Sequence
-        
-        :returns:
-            A function which returns::
-            
-                imap(lambda x, y: x /= y, self, other)
-        
-        :rtype:
-            FunctionType -> GeneratorType
-            
-        .. warning::
-            
-            For mutable types, this operations can not be undone once finalized.
-        """
-        iterable = object.__getattribute__(self, "iterable")
-        return lambda: itertools.imap(lambda x, y: x.__idiv__(y), iterable, other)
-
-    @chainable
-    @cacheable
-    def __itruediv__(self, other):
-        """            
-        :parameter other:
-            The other object to use for each element of the PairwiseProxy
-        
-        :type others:
-            Sequence
-        
-        :returns:
-            A function which returns::
-            
-                imap(lambda x, y: x /= y, self, other)
-        
-        :rtype:
-            FunctionType -> GeneratorType
-            
-        .. warning::
-            
-            For mutable types, this operations can not be undone once finalized.
-        """
-        iterable = object.__getattribute__(self, "iterable")
-        return lambda: itertools.imap(lambda x, y: x.__itrue__(y), iterable, other)
-
-    @chainable
-    @cacheable
-    def __ifloordiv__(self, other):
-        """            
-        :parameter other:
-            The other object to use for each element of the PairwiseProxy
-        
-        :type others:
-            Sequence
-        
-        :returns:
-            A function which returns::
-            
-                imap(lambda x, y: x // y, self, other)
-        
-        :rtype:
-            FunctionType -> GeneratorType
-            
-        .. warning::
-            
-            For mutable types, this operations can not be undone once finalized.
-        """
-        iterable = object.__getattribute__(self, "iterable")
-        return lambda: itertools.imap(lambda x, y: x.__ifloordiv__(y), iterable, other)
-
-    @chainable
-    @cacheable
-    def __imod__(self, other):
-        """            
-        :parameter other:
-            The other object to use for each element of the PairwiseProxy
-        
-        :type others:
-            Sequence
-        
-        :returns:
-            A function which returns::
-            
-                imap(lambda x, y: x % y, self, other)
-        
-        :rtype:
-            FunctionType -> GeneratorType
-        
-        .. warning::
-            
-            For mutable types, this operations can not be undone once finalized.
-        """
-        iterable = object.__getattribute__(self, "iterable")
-        return lambda: itertools.imap(lambda x, y: x.__imod__(y), iterable, other)
-
-    @chainable
-    @cacheable
-    def __ipow__(self, other, modulo=None):
-        """            
-        :parameter other:
-            The other object to use for each element of the PairwiseProxy
-        
-        :type others:
-            Sequence
-        
-        :returns:
-            A function which returns::
-            
-                imap(lambda x, y: pow(x, y, modulo), self, other)
-        
-        :rtype:
-            FunctionType -> GeneratorType
-            
-        .. warning::
-            
-            For mutable types, this operations can not be undone once finalized.
-        """
-        iterable = object.__getattribute__(self, "iterable")
-        return lambda: itertools.imap(lambda x, y, z: x.__ipow__(y, modulo), iterable, other)
-
-    @chainable
-    @cacheable
-    def __ilshift__(self, other):
-        """            
-        :parameter other:
-            The other object to use for each element of the PairwiseProxy
-        
-        :type others:
-            Sequence
-        
-        :returns:
-            A function which returns::
-            
-                imap(lambda x, y: x <<= y, self, other)
-        
-        :rtype:
-            FunctionType -> GeneratorType
-            
-        .. warning::
-            
-            For mutable types, this operations can not be undone once finalized.
-        """
-        iterable = object.__getattribute__(self, "iterable")
-        return lambda: itertools.imap(lambda x, y: x.__ilshift__(y), iterable, other)
-
-    @chainable
-    @cacheable
-    def __irshift__(self, other):
-        """            
-        :parameter other:
-            The other object to use for each element of the PairwiseProxy
-        
-        :type others:
-            Sequence
-        
-        :returns:
-            A function which returns::
-            
-                imap(lambda x, y: x >>= y, self, other)
-        
-        :rtype:
-            FunctionType -> GeneratorType
-            
-        .. warning::
-            
-            For mutable types, this operations can not be undone once finalized.
-        """
-        iterable = object.__getattribute__(self, "iterable")
-        return lambda: itertools.imap(lambda x, y: x.__irshift__(y), iterable, other)
+    Recursive chains are not supported, since their elements are branches
+    rather than single values.
+    """
+    if not isinstance(condition, OperationProxy):
+        raise TypeError("The condition must be a chain, not %s" %
+                        type(condition).__name__)
+    if any(isinstance(value, RecursiveElementwiseProxy)
+           for value in (condition, a, b)):
+        raise TypeError("where does not support recursive proxies, use .each "
+                        "to select between the top level elements")
+    step = condition
+    for branch in (a, b):
+        if isinstance(branch, OperationProxy):
+            shared = _shared_step(step, branch)
+            if shared is not None:
+                step = shared[0]
+    def relative(value):
+        # Branches from the shared step are rebuilt on a placeholder for it,
+        # so that replicas of the chain select from their own elements.
+        if isinstance(value, OperationProxy):
+            shared = _shared_step(step, value)
+            if shared is not None:
+                return _replay(type(step)(_Placeholder("branch")), shared[2])
+        return value
+    return step._select(relative(condition), relative(a), relative(b))
 
 
 if __name__ == "__main__":